@@ -1,8 +1,12 @@
+import os
 import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import networkx as nx 
 import matplotlib.pyplot as plt 
-import copy
 import time
+from collections import namedtuple
 
 class Node(object):
     def __init__(self, node_id, weight, covid_infected = False, vaccinated = False):
@@ -44,17 +48,86 @@ class Node(object):
             self.vaccinated = True
 
 
+# What play_one_step changed, so that undo_step can revert it in place. The
+# frontier is the frontier dict a step of a Graph replaced and the at-risk mask
+# of a CompactGraph.
+StepUndo = namedtuple('StepUndo', ['vaccinated_node_id', 'was_vaccinated', 'n_infected_before', 'propagator_nodes',
+                                   'frontier'], defaults=(None,))
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised inside a search once its time or node budget is spent."""
+
+
+class SearchStats(object):
+    """Counters collected by one search for the node to vaccinate, and the
+    optional budget (a time.time() deadline and a number of positions) the
+    search has to stay within."""
+
+    def __init__(self, deadline=None, max_nodes=None):
+        self.nodes_expanded = 0
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.depth_reached = 0
+        self.horizon_reached = False
+        self.elapsed = 0
+
+    def expand_node(self):
+        self.nodes_expanded = self.nodes_expanded + 1
+        if self.max_nodes is not None and self.nodes_expanded > self.max_nodes:
+            raise SearchBudgetExceeded()
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchBudgetExceeded()
+
+    @property
+    def nodes_per_second(self):
+        if self.elapsed == 0:
+            return 0
+        return self.nodes_expanded / self.elapsed
+
+
+# best value found so far by any worker of a parallel search
+_shared_bound = None
+
+
+def _init_search_worker(bound):
+    global _shared_bound
+    _shared_bound = bound
+
+
+def _search_subtree(graph, moves):
+    """Worker side of Graph.node_to_vaccinate_parallel: plays the moves
+    and searches the rest of the game with the bound shared by all workers,
+    publishing the value found so the others can prune against it."""
+
+    for node_id in moves:
+        graph.play_one_step(node_id)
+    stats = SearchStats()
+    value = graph.alpha_beta(_shared_bound.value, float('inf'), stats)
+    with _shared_bound.get_lock():
+        if value > _shared_bound.value:
+            _shared_bound.value = value
+    return value, stats.nodes_expanded
+
+
 class Graph(object):
-    def __init__(self, node_ids, weights, game_over = 0):
+    def __init__(self, node_ids, weights, game_over = 0, first_infected_node_id = 34):
         # structure of graph {node_id: node_object, ...}
         self.graph = {}
+        # kept up to date as the game is played, instead of rescanning the
+        # graph: neutral nodes with an infected neighbour {node_id: node_object},
+        # the number of infected neighbours of every node and the weight totals.
+        self.frontier = {}
+        self.infected_neighbor_counts = {}
+        self.healthy_weight = 0
+        self.infected_weight = 0
         self.vaccinated_node_ids = []
         self.add_nodes(node_ids, weights)
         #first_infected_node_id = random.choice(self.graph.keys())
-        first_infected_node_id = 34
-        self.graph[first_infected_node_id].make_infected()
+        self.infect_node(first_infected_node_id)
         self.infected_node_ids = [first_infected_node_id]
         self.propagator_nodes =[first_infected_node_id]
+        self.game_over = game_over
 
     def add_nodes(self, node_ids, weights):
         for node_id, weight in zip(node_ids, weights):
@@ -66,6 +139,8 @@ class Graph(object):
         else:
             new_node = Node(node_id, weight)
             self.graph[node_id] = new_node
+            self.infected_neighbor_counts[node_id] = 0
+            self.healthy_weight = self.healthy_weight + weight
 
     def add_connections(self, connections):
         for node_1_id, node_2_id in connections:
@@ -74,25 +149,81 @@ class Graph(object):
     def add_connection(self, node_1_id, node_2_id):
         if node_1_id not in self.graph or node_2_id not in self.graph:
             print("one of the nodes does not exist")
-        else:
+        elif node_2_id not in self.graph[node_1_id].get_neighbor_node_ids():
             self.graph[node_1_id].add_neighbor(node_2_id)
             self.graph[node_2_id].add_neighbor(node_1_id)
+            if self.graph[node_1_id].is_infected():
+                self.infected_neighbor_counts[node_2_id] = self.infected_neighbor_counts[node_2_id] + 1
+                self.update_frontier(node_2_id)
+            if self.graph[node_2_id].is_infected():
+                self.infected_neighbor_counts[node_1_id] = self.infected_neighbor_counts[node_1_id] + 1
+                self.update_frontier(node_1_id)
+            if self.graph[node_1_id].is_infected() or self.graph[node_2_id].is_infected():
+                # the neighbours of an infected node may now be scanned in another order
+                self.frontier = self.get_frontier_in_scan_order()
+
+    def get_frontier_in_scan_order(self):
+        """The frontier in the order found by scanning the neutral neighbours
+        of the infected nodes in infection order, which is the order moves
+        are tried in and so decides between equally good moves.
+
+        infect_node keeps the frontier in this order by itself: the nodes it
+        adds are the last ones of the scan. Only adding connections to an
+        infected node reorders its neighbours and needs a new scan."""
+
+        ordered = {}
+        for infected_node_id in self.infected_node_ids:
+            for neighbor_id in self.graph[infected_node_id].get_neighbor_node_ids():
+                if neighbor_id in self.frontier and neighbor_id not in ordered:
+                    ordered[neighbor_id] = self.frontier[neighbor_id]
+        return ordered
+
+    def update_frontier(self, node_id):
+        node = self.graph[node_id]
+        if not node.is_infected() and not node.is_vaccinated() and self.infected_neighbor_counts[node_id] > 0:
+            if node_id not in self.frontier:
+                self.frontier[node_id] = node
+        elif node_id in self.frontier:
+            del self.frontier[node_id]
+
+    def infect_node(self, node_id):
+        """Marks a node infected and updates the frontier and the weight
+        totals. Does not touch infected_node_ids."""
+
+        node = self.graph[node_id]
+        if node.is_infected() or node.is_vaccinated():
+            node.make_infected()
+            return
+        node.make_infected()
+        self.healthy_weight = self.healthy_weight - node.get_weight()
+        self.infected_weight = self.infected_weight + node.get_weight()
+        self.update_frontier(node_id)
+        for neighbor_node_id in node.get_neighbor_node_ids():
+            self.infected_neighbor_counts[neighbor_node_id] = self.infected_neighbor_counts[neighbor_node_id] + 1
+            self.update_frontier(neighbor_node_id)
+
+    def cure_node(self, node_id):
+        """Reverts infect_node, except for the frontier which undo_step
+        restores as a whole."""
+
+        node = self.graph[node_id]
+        node.covid_infected = False
+        self.healthy_weight = self.healthy_weight + node.get_weight()
+        self.infected_weight = self.infected_weight - node.get_weight()
+        for neighbor_node_id in node.get_neighbor_node_ids():
+            self.infected_neighbor_counts[neighbor_node_id] = self.infected_neighbor_counts[neighbor_node_id] - 1
+
+    def get_node_weight(self, node_id):
+        return self.graph[node_id].get_weight()
 
     def get_infected_nodes(self):
         return self.infected_node_ids
 
     def get_sum_of_weights_of_all_infected_nodes(self):
-        infected_sum = 0
-        for infected_node_id in self.infected_node_ids:
-            infected_sum = infected_sum + self.graph[infected_node_id].get_weight()
+        return self.infected_weight
 
-        return infected_sum
     def get_sum_of_weights_of_all_healthy_nodes(self):
-        healthy_sum =0 
-        for id in self.graph.keys():
-            if  not self.graph[id].is_infected():
-                healthy_sum = healthy_sum + self.graph[id].get_weight()
-        return healthy_sum      
+        return self.healthy_weight
 
     def get_sum_of_weights_of_neighbouring_neutral_nodes(self, node_1_id):
         neutral_neighbor_ids = self.get_neutral_neighbor_ids_of_a_node(node_1_id)
@@ -101,6 +232,11 @@ class Graph(object):
             weighted_sum = weighted_sum + self.graph[neighbor_node_id].get_weight()
         return weighted_sum
 
+    def get_vaccination_score(self, node_id):
+        """Greedy score of vaccinating a node: its own weight plus the weight
+        of the neutral neighbours it shields from the infection."""
+        return self.get_sum_of_weights_of_neighbouring_neutral_nodes(node_id) + self.get_node_weight(node_id)
+
     def get_neutral_neighbor_ids_of_a_node(self, node_id):
         neutral_neighbor_ids = []
         if node_id not in self.graph:
@@ -118,70 +254,249 @@ class Graph(object):
         else:
             self.vaccinated_node_ids.append(node_id)
             self.graph[node_id].vaccinate_node()
+            self.update_frontier(node_id)
     
     def get_nodes_that_will_be_infected_in_next_step(self):
         """Gets the node objects to which the infection will spread in the next
         round. We have to select one node out of these to vaccinate."""
 
-        nodes_that_will_be_infected = {}
-        for infected_node_id in self.infected_node_ids:
-            neighbor_ids_of_infected_node = self.get_neutral_neighbor_ids_of_a_node(infected_node_id)
-            for neighbor_id in neighbor_ids_of_infected_node:
-                if neighbor_id not in nodes_that_will_be_infected:
-                    nodes_that_will_be_infected[neighbor_id] = self.graph[neighbor_id]
-        if(len(nodes_that_will_be_infected) == 0):
-            self.game_over = 1
+        nodes_that_will_be_infected = dict(self.frontier)
+        self.game_over = int(len(nodes_that_will_be_infected) == 0)
         return nodes_that_will_be_infected
 
     def play_one_step(self, vaccinate_node_id = None):
         """One step of the game proceeds. The node id given is vaccinated
-        and the infection spreads to all the neighboring nodes."""
+        and the infection spreads to all the neighboring nodes. Returns the
+        record to pass to undo_step to take the step back."""
 
-        nodes_about_to_be_infected = []
+        undo = StepUndo(None, False, len(self.infected_node_ids), self.propagator_nodes)
         if vaccinate_node_id:
+            if vaccinate_node_id in self.graph:
+                undo = undo._replace(vaccinated_node_id=vaccinate_node_id,
+                                     was_vaccinated=self.graph[vaccinate_node_id].is_vaccinated())
+            # every entry of the frontier is vaccinated or infected, so the step
+            # fills a new frontier with the entries it adds and the old one is
+            # kept unchanged in the undo record, instead of copied
+            nodes_about_to_be_infected = self.frontier
+            undo = undo._replace(frontier=nodes_about_to_be_infected)
+            self.frontier = {}
             self.vaccinate_node(vaccinate_node_id)
-            for infected_node_id in self.infected_node_ids:
-                neutral_neighbor_ids = self.get_neutral_neighbor_ids_of_a_node(infected_node_id)
-                for neutral_neighbor_node_id in neutral_neighbor_ids:
-                    if neutral_neighbor_node_id not in nodes_about_to_be_infected:
-                        nodes_about_to_be_infected.append(neutral_neighbor_node_id)
-            self.propagator_nodes = nodes_about_to_be_infected
 
             for node_id in nodes_about_to_be_infected:
-                if node_id not in self.infected_node_ids and node_id not in self.vaccinated_node_ids:
+                if node_id != vaccinate_node_id:
                     self.infected_node_ids.append(node_id)
-                    self.graph[node_id].make_infected()
-
-    def node_to_vaccinate_alternate_alpha(self):
-        temporary_graph = copy.deepcopy(self)
+                    self.infect_node(node_id)
+            self.propagator_nodes = self.infected_node_ids[undo.n_infected_before:]
+        return undo
+
+    def undo_step(self, undo):
+        """Reverts the step that returned this undo record. Steps have to be
+        undone in the reverse order they were played."""
+
+        for node_id in self.infected_node_ids[undo.n_infected_before:]:
+            self.cure_node(node_id)
+        del self.infected_node_ids[undo.n_infected_before:]
+        if undo.vaccinated_node_id is not None:
+            self.vaccinated_node_ids.pop()
+            self.graph[undo.vaccinated_node_id].vaccinated = undo.was_vaccinated
+        self.propagator_nodes = undo.propagator_nodes
+        if undo.frontier is not None:
+            self.frontier = undo.frontier
+
+    def get_moves_in_search_order(self, nodes_that_will_be_infected):
+        """Candidate nodes to vaccinate, best greedy score first so that good
+        lines are found early and the remaining ones can be pruned."""
+        return sorted(nodes_that_will_be_infected, key=self.get_vaccination_score, reverse=True)
+
+    def node_to_vaccinate_alternate_alpha(self, alpha=float('-inf'), beta=float('inf')):
+        """Alpha-beta version of node_to_vaccinate_alternate. The infection is
+        not an adversary, so the only player maximizes the healthy weight and
+        subtrees are cut using an upper bound on what they can still save:
+        after vaccinating a node every other node at risk gets infected.
+
+        Returns the same node and value as the exhaustive search, the number
+        of positions searched is left in self.search_stats."""
+
+        stats = SearchStats()
+        values = self.get_alpha_beta_root_values(alpha, beta, stats)
+        self.search_stats = stats
+        if len(values) == 0:
+            return None, self.get_sum_of_weights_of_all_healthy_nodes()
+        max_value_key = max(values, key=values.get)
+        return max_value_key, values[max_value_key]
+
+    def get_alpha_beta_root_values(self, alpha, beta, stats, depth=None, first_move=None):
+        """Values of the root moves in frontier order. Moves whose subtree was
+        pruned are left out, the others are exact whenever they reach alpha.
+        first_move, if given, is searched before the others."""
+
+        stats.expand_node()
+        nodes_that_will_be_infected = self.get_nodes_that_will_be_infected_in_next_step()
         values = {}
-        nodes_that_will_be_infected = temporary_graph.get_nodes_that_will_be_infected_in_next_step()
+        healthy_sum = self.get_sum_of_weights_of_all_healthy_nodes()
+        at_risk_sum = 0
+        for node_id in nodes_that_will_be_infected:
+            at_risk_sum = at_risk_sum + self.get_node_weight(node_id)
+
+        moves = self.get_moves_in_search_order(nodes_that_will_be_infected)
+        if first_move in nodes_that_will_be_infected:
+            moves.remove(first_move)
+            moves.insert(0, first_move)
+        for node_id in moves:
+            if healthy_sum - at_risk_sum + self.get_node_weight(node_id) < alpha:
+                continue
+            undo = self.play_one_step(node_id)
+            try:
+                values[node_id] = self.alpha_beta(alpha, beta, stats, depth)
+            finally:
+                self.undo_step(undo)
+            alpha = max(alpha, values[node_id])
+
+        # keep the tie breaking of the exhaustive search
+        return {node_id: values[node_id] for node_id in nodes_that_will_be_infected if node_id in values}
+
+    def alpha_beta(self, alpha, beta, stats, depth=None):
+        """Best healthy weight reachable from this position. The result is
+        exact when it lies within [alpha, beta], otherwise it only bounds the
+        true value. Subtrees that cannot reach alpha are skipped and equal
+        values are still searched, which keeps ties exact for the caller.
+
+        With a depth, positions that many moves ahead are scored by their
+        healthy weight instead of being searched further."""
+
+        stats.expand_node()
+        nodes_that_will_be_infected = self.get_nodes_that_will_be_infected_in_next_step()
+        healthy_sum = self.get_sum_of_weights_of_all_healthy_nodes()
         if len(nodes_that_will_be_infected) == 0:
-            return None, temporary_graph.get_sum_of_weights_of_all_healthy_nodes()
-        else:
-            for node_id in nodes_that_will_be_infected:
-                temporary_graph.play_one_step(node_id)
-                if temporary_graph.get_sum_of_weights_of_all_healthy_nodes()<12000:
-                    values[node_id] = 0
-                    next_node_to_save = None
-                else:
-                    next_node_to_save, values[node_id] = temporary_graph.node_to_vaccinate_alternate_alpha()
-                temporary_graph = copy.deepcopy(self)
-
-            max_value_key = max(values, key=values.get)
-            return max_value_key, values[max_value_key]
-
-    def node_to_vaccinate_alternate(self):
-        temporary_graph = copy.deepcopy(self)
+            return healthy_sum
+        if depth == 0:
+            stats.horizon_reached = True
+            return healthy_sum
+        if depth is not None:
+            depth = depth - 1
+
+        at_risk_sum = 0
+        max_weight = 0
+        for node_id in nodes_that_will_be_infected:
+            at_risk_sum = at_risk_sum + self.get_node_weight(node_id)
+            max_weight = max(max_weight, self.get_node_weight(node_id))
+        # no line can save more than the heaviest node at risk
+        beta = min(beta, healthy_sum - at_risk_sum + max_weight)
+
+        best_value = float('-inf')
+        for node_id in self.get_moves_in_search_order(nodes_that_will_be_infected):
+            if healthy_sum - at_risk_sum + self.get_node_weight(node_id) < alpha:
+                continue
+            undo = self.play_one_step(node_id)
+            try:
+                value = self.alpha_beta(alpha, beta, stats, depth)
+            finally:
+                self.undo_step(undo)
+            best_value = max(best_value, value)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return best_value
+
+    def node_to_vaccinate_anytime(self, time_budget=None, node_budget=None, max_depth=None):
+        """Iterative deepening version of node_to_vaccinate_alternate_alpha
+        which stays within time_budget seconds and/or node_budget expanded
+        positions. Every iteration searches one move deeper, scoring the
+        positions at the horizon by their healthy weight, and the best move
+        of the last finished iteration is returned. Once an iteration never
+        reaches the horizon its result is exact and the search stops.
+
+        The depth reached and positions searched per second are left in
+        self.search_stats."""
+
+        start_time = time.time()
+        deadline = start_time + time_budget if time_budget is not None else None
+        stats = self.search_stats = SearchStats(deadline, node_budget)
+        nodes_that_will_be_infected = self.get_nodes_that_will_be_infected_in_next_step()
+        healthy_sum = self.get_sum_of_weights_of_all_healthy_nodes()
+        if len(nodes_that_will_be_infected) == 0:
+            return None, healthy_sum
+
+        # fall back on the greedy choice if not even one move fits the budget
+        max_value_key = self.get_moves_in_search_order(nodes_that_will_be_infected)[0]
+        max_value = healthy_sum + self.get_node_weight(max_value_key)
+        for node_id in nodes_that_will_be_infected:
+            max_value = max_value - self.get_node_weight(node_id)
+        depth = 1
+        try:
+            while max_depth is None or depth <= max_depth:
+                stats.horizon_reached = False
+                values = self.get_alpha_beta_root_values(float('-inf'), float('inf'), stats, depth, max_value_key)
+                max_value_key = max(values, key=values.get)
+                max_value = values[max_value_key]
+                stats.depth_reached = depth
+                if not stats.horizon_reached:
+                    break
+                depth = depth + 1
+        except SearchBudgetExceeded:
+            pass
+        stats.elapsed = time.time() - start_time
+        return max_value_key, max_value
+
+    def get_split_moves(self, depth):
+        """Every sequence of depth moves from this position, in frontier
+        order. Sequences are shorter where the game ends earlier."""
+
+        nodes_that_will_be_infected = self.get_nodes_that_will_be_infected_in_next_step()
+        if depth == 0 or len(nodes_that_will_be_infected) == 0:
+            return [()]
+        sequences = []
+        for node_id in nodes_that_will_be_infected:
+            undo = self.play_one_step(node_id)
+            for moves in self.get_split_moves(depth - 1):
+                sequences.append((node_id,) + moves)
+            self.undo_step(undo)
+        return sequences
+
+    def node_to_vaccinate_parallel(self, workers=None, split_depth=1):
+        """Parallel version of node_to_vaccinate_alternate_alpha. The subtrees
+        after the first split_depth moves (1 splits the root, 2 also the
+        second ply) are searched by a pool of worker processes, defaulting
+        to one per core, which share the best value found so far for pruning.
+
+        Returns the same node and value as the serial searches."""
+
+        nodes_that_will_be_infected = self.get_nodes_that_will_be_infected_in_next_step()
+        if len(nodes_that_will_be_infected) == 0:
+            return None, self.get_sum_of_weights_of_all_healthy_nodes()
+
+        sequences = self.get_split_moves(split_depth)
+        # submit the most promising root moves first to raise the bound early
+        rank = {node_id: i for i, node_id in enumerate(self.get_moves_in_search_order(nodes_that_will_be_infected))}
+        bound = multiprocessing.Value('d', float('-inf'))
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_search_worker,
+                                 initargs=(bound,)) as executor:
+            futures = {moves: executor.submit(_search_subtree, self, moves)
+                       for moves in sorted(sequences, key=lambda moves: rank[moves[0]])}
+
+        stats = SearchStats()
+        values = {}
+        for moves in sequences:
+            value, nodes_expanded = futures[moves].result()
+            stats.nodes_expanded = stats.nodes_expanded + nodes_expanded
+            values[moves[0]] = max(values.get(moves[0], float('-inf')), value)
+        self.search_stats = stats
+        max_value_key = max(values, key=values.get)
+        return max_value_key, values[max_value_key]
+
+    def node_to_vaccinate_alternate(self, stats=None):
+        if stats is None:
+            stats = self.search_stats = SearchStats()
+        stats.expand_node()
         values = {}
-        nodes_that_will_be_infected = temporary_graph.get_nodes_that_will_be_infected_in_next_step()
+        nodes_that_will_be_infected = self.get_nodes_that_will_be_infected_in_next_step()
         if len(nodes_that_will_be_infected) == 0:
-            return None, temporary_graph.get_sum_of_weights_of_all_healthy_nodes()
+            return None, self.get_sum_of_weights_of_all_healthy_nodes()
         else:
             for node_id in nodes_that_will_be_infected:
-                temporary_graph.play_one_step(node_id)
-                next_node_to_save, values[node_id] = temporary_graph.node_to_vaccinate_alternate()
-                temporary_graph = copy.deepcopy(self)
+                undo = self.play_one_step(node_id)
+                next_node_to_save, values[node_id] = self.node_to_vaccinate_alternate(stats)
+                self.undo_step(undo)
 
             max_value_key = max(values, key=values.get)
             return max_value_key, values[max_value_key]
@@ -192,76 +507,358 @@ class Graph(object):
         for node_id in self.propagator_nodes:
             node_l1 = self.get_neutral_neighbor_ids_of_a_node(node_id)
             for node_id_l1 in node_l1:
-                if (max_sum_weight< self.get_sum_of_weights_of_neighbouring_neutral_nodes(node_id_l1)) + self.graph[node_id_l1].get_weight():
-                    max_sum_weight = self.get_sum_of_weights_of_neighbouring_neutral_nodes(node_id_l1) +self.graph[node_id_l1].get_weight()
+                if max_sum_weight < self.get_vaccination_score(node_id_l1):
+                    max_sum_weight = self.get_vaccination_score(node_id_l1)
                     node_vaccinate = node_id_l1
 
         return node_vaccinate
 
-# assigning node ids, weights and start of game play.
-node_ids = [i for i in range(1,101)]
-weights = [i for i in range(10,1010,10)]
-
-# initialize a graph - the first infected node is randomly chosen.
-graph = Graph(node_ids, weights)
-
-# get the id of the first infected node.
-first_infected_node = graph.get_infected_nodes()[0]
-# print the id of the first infected node.
-print("First infected node: "), first_infected_node
-
-# connections between nodes
-connections = [(61, 66), (3, 83), (48, 99), (49, 56), (57, 86), (75, 99), (5, 46), (37, 49), (19, 35), (50, 88), (21, 43), (69, 93), (15, 42), (57, 70), (21, 93), (48, 90), (26, 48), (5, 67), (67, 86), (23, 76), (42, 88), (67, 93), (23, 51), (17, 58), (35, 86), (61, 68), (38, 40), (47, 68), (34, 40), (86, 92), (5, 77), (34, 56), (11, 80), (18, 80), (67, 73), (16, 78), (51, 98), (8, 68), (3, 21), (8, 13), (36, 38), (14, 58), (45, 66), (5, 86), (23, 46), (36, 65), (67, 89), (9, 90), (28, 94), (4, 57), (36, 48), (40, 99), (88, 100), (34, 69), (81, 90), (83, 96), (11, 40), (14, 42), (18, 30), (45, 58), (47, 86), (15, 26), (45, 59), (3, 29), (39, 41), (16, 83), (39, 73), (3, 6), (33, 93), (18, 40), (30, 98), (35, 90), (55, 71), (20, 65), (10, 77), (37, 58), (41, 65), (45, 100), (55, 84), (23, 85), (77, 89), (8, 34), (5, 35), (19, 77), (7, 61), (23, 80), (69, 82), (4, 59), (39, 94), (17, 79), (16, 17), (1, 59), (90, 91), (2, 28), (31, 51), (23, 40), (43, 72), (31, 85), (76, 92), (31, 63)]
-
-# create connections
-graph.add_connections(connections)
-
-#initializing the graph to draw, add the nodes and connections.
-g = nx.Graph()
-g.add_nodes_from(node_ids)
-g.add_edges_from(connections)
-
-# Specify appearance of node.
-graph_pos = nx.shell_layout(g)
-
-# Creating the graph to draw, adding edges and nodes (all blue) with initial edge conditions.
-nx.draw(g,graph_pos,with_labels=True,node_color='green',node_size=50)
-plt.show()
-
-print("Close images to proceed.")
-print('\n')
-
-
-# Start game play.
-while (len(graph.get_nodes_that_will_be_infected_in_next_step())):
-    # id = graph.node_to_vaccinate()
-    start_time = time.time() 
-    id = graph.node_to_vaccinate_alternate()[0]
-    print("Time elapsed : " + str(time.time()-start_time))
-    #color_map = []                     #updating color map at each step of the loop
-    #for x in graph.graph.keys():
-    #    if graph.graph[x].is_infected():
-    #        color_map.append('red')
-    #    elif graph.graph[x].is_vaccinated():
-    #        color_map.append('blue')
-    #    else:
-    #        color_map.append('green')    
-    #print "node to vaccinate :", id
-    
-    # Update graph conditions.
-    #nx.draw(g,graph_pos,node_color=color_map,with_labels=True, node_size=500, ax=ax)
-    #plt.show()
-    graph.play_one_step(id)
-
-graph.play_one_step()
-color_map = []
-for x in graph.graph.keys():
-    if graph.graph[x].is_infected():
-       color_map.append('red')
-    elif graph.graph[x].is_vaccinated():
-        color_map.append('blue')
-    else:
-        color_map.append('green') 
-nx.draw(g,graph_pos,node_color=color_map,with_labels=True, node_size=50)
-plt.show()
-print("Sum of weights of healthy nodes saved:", graph.get_sum_of_weights_of_all_healthy_nodes())
\ No newline at end of file
+
+class CompactNode(object):
+    """Node of a CompactGraph: a view of its entries in the arrays of the
+    graph with the read methods of Node. The state of a node is changed
+    through the graph, like infect_node and vaccinate_node of Graph."""
+
+    __slots__ = ('owner', 'id', 'index')
+
+    def __init__(self, owner, node_id, index):
+        self.owner = owner
+        self.id = node_id
+        self.index = index
+
+    @property
+    def weight(self):
+        return self.owner.node_weights[self.id]
+
+    @property
+    def neighbors(self):
+        return set(self.owner.node_ids[self.owner.get_neighbor_indexes(self.id)].tolist())
+
+    def get_weight(self):
+        return self.weight
+
+    def is_infected(self):
+        return bool(self.owner.infected[self.index])
+
+    def is_vaccinated(self):
+        return bool(self.owner.vaccinated[self.index])
+
+    def get_neighbor_node_ids(self):
+        return self.neighbors
+
+
+class CompactGraph(Graph):
+    """Array backed drop-in replacement for Graph. Adjacency is kept in CSR
+    form (indptr/indices NumPy arrays over node indexes) and the infected and
+    vaccinated state in boolean arrays, so frontier and weight queries are
+    vectorized instead of walking Node objects. The searches are inherited
+    from Graph and only go through the methods overridden here.
+
+    The public methods are the ones of Graph and take node ids, graph maps
+    the node ids to CompactNode views. The frontier is not a dict kept up to
+    date but the at-risk mask of the position, see get_at_risk_mask, so the
+    nodes at risk come in node order instead of Graph's scan order and the
+    searches may return another move among equally good ones.
+    get_frontier_in_scan_order gives them in scan order.
+
+    Every position searched costs a few NumPy calls, so on small graphs the
+    exhaustive search is slower than with Graph; the alpha-beta searches,
+    which order the moves in one vectorized pass, are faster from about 40
+    nodes on."""
+
+    def __init__(self, node_ids, weights, game_over = 0, first_infected_node_id = 34):
+        self.node_ids = np.zeros(0, dtype=np.int64)
+        self.node_index = {}
+        # {node_id: CompactNode}
+        self.graph = {}
+        self.weights = np.zeros(0, dtype=np.int64)
+        # the same weights by node id, for the scalar lookups of the searches,
+        # and the weight totals kept up to date like in Graph
+        self.node_weights = {}
+        self.healthy_weight = 0
+        self.infected_weight = 0
+        self.infected = np.zeros(0, dtype=bool)
+        self.vaccinated = np.zeros(0, dtype=bool)
+        self.edges = []
+        self.indptr = None
+        self.indices = None
+        # nodes at risk of the current position, see get_at_risk_mask
+        self.at_risk = None
+        self.vaccinated_node_ids = []
+        self.add_nodes(node_ids, weights)
+        self.infect_node(first_infected_node_id)
+        self.infected_node_ids = [first_infected_node_id]
+        self.propagator_nodes = [first_infected_node_id]
+        self.game_over = game_over
+
+    def add_nodes(self, node_ids, weights):
+        new_node_ids = []
+        new_weights = []
+        for node_id, weight in zip(node_ids, weights):
+            if node_id in self.node_index:
+                print("node already exists")
+            else:
+                self.node_index[node_id] = len(self.node_index)
+                self.graph[node_id] = CompactNode(self, node_id, self.node_index[node_id])
+                self.node_weights[node_id] = weight
+                self.healthy_weight = self.healthy_weight + weight
+                new_node_ids.append(node_id)
+                new_weights.append(weight)
+        self.node_ids = np.concatenate([self.node_ids, np.array(new_node_ids, dtype=np.int64)])
+        self.weights = np.concatenate([self.weights, np.array(new_weights, dtype=np.int64)])
+        self.infected = np.concatenate([self.infected, np.zeros(len(new_node_ids), dtype=bool)])
+        self.vaccinated = np.concatenate([self.vaccinated, np.zeros(len(new_node_ids), dtype=bool)])
+        self.indptr = None
+        self.at_risk = None
+
+    def add_node(self, node_id, weight):
+        self.add_nodes([node_id], [weight])
+
+    def add_connection(self, node_1_id, node_2_id):
+        if node_1_id not in self.node_index or node_2_id not in self.node_index:
+            print("one of the nodes does not exist")
+        else:
+            self.edges.append((self.node_index[node_1_id], self.node_index[node_2_id]))
+            self.indptr = None
+            self.at_risk = None
+
+    def get_adjacency(self):
+        """CSR adjacency (indptr, indices, rows) where the neighbours of node
+        index i are indices[indptr[i]:indptr[i + 1]] and rows[k] is the node
+        owning entry k. Rebuilt lazily after nodes or connections are added."""
+
+        if self.indptr is None:
+            n = len(self.node_ids)
+            pairs = np.array(self.edges, dtype=np.int64).reshape(-1, 2)
+            pairs = np.concatenate([pairs, pairs[:, ::-1]])
+            pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+            self.indices = pairs[:, 1]
+            self.indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(pairs[:, 0], minlength=n), out=self.indptr[1:])
+            self.rows = pairs[:, 0]
+        return self.indptr, self.indices, self.rows
+
+    def get_neighbor_indexes(self, node_id):
+        indptr, indices, rows = self.get_adjacency()
+        i = self.node_index[node_id]
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def get_node_weight(self, node_id):
+        return self.node_weights[node_id]
+
+    def get_sum_of_weights_of_neighbouring_neutral_nodes(self, node_1_id):
+        if node_1_id not in self.node_index:
+            print("node does not exist")
+            return 0
+        neighbors = self.get_neighbor_indexes(node_1_id)
+        neutral = ~self.infected[neighbors] & ~self.vaccinated[neighbors]
+        return int(self.weights[neighbors[neutral]].sum())
+
+    def get_neutral_neighbor_ids_of_a_node(self, node_id):
+        if node_id not in self.node_index:
+            print("node does not exist")
+            return []
+        neighbors = self.get_neighbor_indexes(node_id)
+        neutral = ~self.infected[neighbors] & ~self.vaccinated[neighbors]
+        return self.node_ids[neighbors[neutral]].tolist()
+
+    def update_frontier(self, node_id):
+        """Updates whether the node is at risk in the cached at-risk mask,
+        after its state was changed in the arrays."""
+
+        if self.at_risk is None:
+            return
+        i = self.node_index[node_id]
+        neighbors = self.get_neighbor_indexes(node_id)
+        at_risk = not self.infected[i] and not self.vaccinated[i] and self.infected[neighbors].any()
+        if at_risk != self.at_risk[i]:
+            # the mask may be held by an undo record
+            self.at_risk = self.at_risk.copy()
+            self.at_risk[i] = at_risk
+
+    def get_frontier_in_scan_order(self):
+        """The nodes at risk in the order of the scan of
+        Graph.get_frontier_in_scan_order. Neighbours are scanned in node
+        order, where Graph follows the order of its neighbour sets."""
+
+        at_risk = self.get_at_risk_mask()
+        ordered = {}
+        for infected_node_id in self.infected_node_ids:
+            for neighbor_id in self.node_ids[self.get_neighbor_indexes(infected_node_id)].tolist():
+                if at_risk[self.node_index[neighbor_id]] and neighbor_id not in ordered:
+                    ordered[neighbor_id] = self.graph[neighbor_id]
+        return ordered
+
+    def infect_node(self, node_id):
+        """Marks a node infected, unless it is vaccinated, and updates the
+        weight totals. Does not touch infected_node_ids."""
+
+        i = self.node_index[node_id]
+        if self.infected[i]:
+            print("node already infected")
+        elif self.vaccinated[i]:
+            print("node already vaccinated")
+        else:
+            self.infected[i] = True
+            self.healthy_weight = self.healthy_weight - self.node_weights[node_id]
+            self.infected_weight = self.infected_weight + self.node_weights[node_id]
+            self.at_risk = None
+
+    def cure_node(self, node_id):
+        """Reverts infect_node."""
+
+        self.infected[self.node_index[node_id]] = False
+        self.healthy_weight = self.healthy_weight + self.node_weights[node_id]
+        self.infected_weight = self.infected_weight - self.node_weights[node_id]
+        self.at_risk = None
+
+    def vaccinate_node(self, node_id):
+        if node_id not in self.node_index:
+            print("node does not exist")
+        else:
+            self.vaccinated_node_ids.append(node_id)
+            i = self.node_index[node_id]
+            if self.vaccinated[i]:
+                print("node already vaccinated")
+            elif self.infected[i]:
+                print("node already infected")
+            else:
+                self.vaccinated[i] = True
+                self.update_frontier(node_id)
+
+    def get_at_risk_mask(self):
+        """Boolean mask of the neutral nodes with at least one infected
+        neighbour, i.e. the nodes infected by the next step. Cached until the
+        position changes and kept in the undo records, so it is built once
+        per position searched. Do not modify it in place."""
+
+        if self.at_risk is None:
+            indptr, indices, rows = self.get_adjacency()
+            at_risk = np.zeros(len(self.node_ids), dtype=bool)
+            at_risk[indices[self.infected[rows]]] = True
+            at_risk &= ~self.infected & ~self.vaccinated
+            self.at_risk = at_risk
+        return self.at_risk
+
+    def get_moves_in_search_order(self, nodes_that_will_be_infected):
+        """Same order as Graph, with the vaccination scores of all the nodes
+        computed at once from the adjacency."""
+
+        indptr, indices, rows = self.get_adjacency()
+        neutral = ~self.infected & ~self.vaccinated
+        scores = self.weights + np.bincount(rows, weights=self.weights[indices] * neutral[indices],
+                                            minlength=len(self.node_ids))
+        node_indexes = np.array([self.node_index[node_id] for node_id in nodes_that_will_be_infected], dtype=np.int64)
+        order = np.argsort(-scores[node_indexes], kind='stable')
+        return self.node_ids[node_indexes[order]].tolist()
+
+    def get_nodes_that_will_be_infected_in_next_step(self):
+        """Same as Graph, in node order."""
+
+        at_risk = self.get_at_risk_mask()
+        nodes_that_will_be_infected = {node_id: self.graph[node_id] for node_id in self.node_ids[at_risk].tolist()}
+        self.game_over = int(len(nodes_that_will_be_infected) == 0)
+        return nodes_that_will_be_infected
+
+    def play_one_step(self, vaccinate_node_id = None):
+        undo = StepUndo(None, False, len(self.infected_node_ids), self.propagator_nodes, self.at_risk)
+        if vaccinate_node_id:
+            if vaccinate_node_id in self.node_index:
+                undo = undo._replace(vaccinated_node_id=vaccinate_node_id,
+                                     was_vaccinated=bool(self.vaccinated[self.node_index[vaccinate_node_id]]))
+            self.vaccinate_node(vaccinate_node_id)
+            at_risk = self.get_at_risk_mask()
+            self.infected |= at_risk
+            self.at_risk = None
+            nodes_about_to_be_infected = self.node_ids[at_risk].tolist()
+            infected_weight = sum(self.node_weights[node_id] for node_id in nodes_about_to_be_infected)
+            self.healthy_weight = self.healthy_weight - infected_weight
+            self.infected_weight = self.infected_weight + infected_weight
+            self.infected_node_ids.extend(nodes_about_to_be_infected)
+            self.propagator_nodes = nodes_about_to_be_infected
+        return undo
+
+    def undo_step(self, undo):
+        cured_weight = 0
+        for node_id in self.infected_node_ids[undo.n_infected_before:]:
+            self.infected[self.node_index[node_id]] = False
+            cured_weight = cured_weight + self.node_weights[node_id]
+        self.healthy_weight = self.healthy_weight + cured_weight
+        self.infected_weight = self.infected_weight - cured_weight
+        del self.infected_node_ids[undo.n_infected_before:]
+        if undo.vaccinated_node_id is not None:
+            self.vaccinated_node_ids.pop()
+            self.vaccinated[self.node_index[undo.vaccinated_node_id]] = undo.was_vaccinated
+        self.propagator_nodes = undo.propagator_nodes
+        self.at_risk = undo.frontier
+
+if __name__ == "__main__":
+    # assigning node ids, weights and start of game play.
+    node_ids = [i for i in range(1,101)]
+    weights = [i for i in range(10,1010,10)]
+
+    # initialize a graph - the first infected node is randomly chosen.
+    graph = Graph(node_ids, weights)
+
+    # get the id of the first infected node.
+    first_infected_node = graph.get_infected_nodes()[0]
+    # print the id of the first infected node.
+    print("First infected node: "), first_infected_node
+
+    # connections between nodes
+    connections = [(61, 66), (3, 83), (48, 99), (49, 56), (57, 86), (75, 99), (5, 46), (37, 49), (19, 35), (50, 88), (21, 43), (69, 93), (15, 42), (57, 70), (21, 93), (48, 90), (26, 48), (5, 67), (67, 86), (23, 76), (42, 88), (67, 93), (23, 51), (17, 58), (35, 86), (61, 68), (38, 40), (47, 68), (34, 40), (86, 92), (5, 77), (34, 56), (11, 80), (18, 80), (67, 73), (16, 78), (51, 98), (8, 68), (3, 21), (8, 13), (36, 38), (14, 58), (45, 66), (5, 86), (23, 46), (36, 65), (67, 89), (9, 90), (28, 94), (4, 57), (36, 48), (40, 99), (88, 100), (34, 69), (81, 90), (83, 96), (11, 40), (14, 42), (18, 30), (45, 58), (47, 86), (15, 26), (45, 59), (3, 29), (39, 41), (16, 83), (39, 73), (3, 6), (33, 93), (18, 40), (30, 98), (35, 90), (55, 71), (20, 65), (10, 77), (37, 58), (41, 65), (45, 100), (55, 84), (23, 85), (77, 89), (8, 34), (5, 35), (19, 77), (7, 61), (23, 80), (69, 82), (4, 59), (39, 94), (17, 79), (16, 17), (1, 59), (90, 91), (2, 28), (31, 51), (23, 40), (43, 72), (31, 85), (76, 92), (31, 63)]
+
+    # create connections
+    graph.add_connections(connections)
+
+    #initializing the graph to draw, add the nodes and connections.
+    g = nx.Graph()
+    g.add_nodes_from(node_ids)
+    g.add_edges_from(connections)
+
+    # Specify appearance of node.
+    graph_pos = nx.shell_layout(g)
+
+    # Creating the graph to draw, adding edges and nodes (all blue) with initial edge conditions.
+    nx.draw(g,graph_pos,with_labels=True,node_color='green',node_size=50)
+    plt.show()
+
+    print("Close images to proceed.")
+    print('\n')
+
+
+    # Start game play.
+    while (len(graph.get_nodes_that_will_be_infected_in_next_step())):
+        # id = graph.node_to_vaccinate()
+        start_time = time.time() 
+        # at most 10 seconds per move, however large the graph.
+        id = graph.node_to_vaccinate_anytime(time_budget=10)[0]
+        print("Time elapsed : " + str(time.time()-start_time))
+        print("Depth reached : " + str(graph.search_stats.depth_reached) + ", nodes per second : " + str(int(graph.search_stats.nodes_per_second)))
+        #color_map = []                     #updating color map at each step of the loop
+        #for x in graph.graph.keys():
+        #    if graph.graph[x].is_infected():
+        #        color_map.append('red')
+        #    elif graph.graph[x].is_vaccinated():
+        #        color_map.append('blue')
+        #    else:
+        #        color_map.append('green')    
+        #print "node to vaccinate :", id
+
+        # Update graph conditions.
+        #nx.draw(g,graph_pos,node_color=color_map,with_labels=True, node_size=500, ax=ax)
+        #plt.show()
+        graph.play_one_step(id)
+
+    graph.play_one_step()
+    color_map = []
+    for x in graph.graph.keys():
+        if graph.graph[x].is_infected():
+           color_map.append('red')
+        elif graph.graph[x].is_vaccinated():
+            color_map.append('blue')
+        else:
+            color_map.append('green') 
+    nx.draw(g,graph_pos,node_color=color_map,with_labels=True, node_size=50)
+    plt.show()
+    print("Sum of weights of healthy nodes saved:", graph.get_sum_of_weights_of_all_healthy_nodes())
@@ -0,0 +1,225 @@
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from simulator import City, Env, Location, Human, ENCOUNTER_MODES
+from tournament import random_contact_graph
+
+START_TIME = datetime.datetime(2020, 2, 28, 0, 0)
+# locations of the cities of the suite, the defaults of run.py sim, only the population grows
+CITY = dict(n_stores=100, n_parks=20, n_misc=100, init_percent_sick=0.01)
+
+
+@click.group()
+def bench():
+    pass
+
+
+def time_encounter_mode(encounter_mode, occupancy, n_arrivals, seed=0):
+    """events logged and seconds spent by n_arrivals arrivals at a location with occupancy humans"""
+    env = Env(START_TIME, encounter_mode=encounter_mode, seed=seed)
+    rng = env.rng.component('benchmark')
+    household = Location(env, name='household0', location_type='household', lat=0, lon=0, cont_prob=1)
+    store = Location(env, name='store0', location_type='store', lat=0, lon=0, cont_prob=0.1)
+    humans = [Human(env, name=i, infection_time=None, household=household, workplace=household)
+              for i in range(occupancy)]
+    for human in humans:
+        human.start_time = 0
+        human.leaving_time = int(rng.integers(1, 61))
+        store.add_human(human)
+
+    start_time = time.time()
+    for i in rng.integers(0, len(humans), n_arrivals).tolist():
+        humans[i].encounter(store)
+    env.event_log.close_contacts()
+    return {
+        'encounter_mode': encounter_mode,
+        'events': len(env.event_log),
+        'seconds': time.time() - start_time,
+    }
+
+
+@bench.command()
+@click.option('--occupancy', help='number of humans at the location', type=int, default=500)
+@click.option('--n_arrivals', help='number of arrivals to time', type=int, default=2000)
+def encounters(occupancy=500, n_arrivals=2000):
+    """events logged and time spent per arrival at a crowded location, for each encounter mode"""
+    for encounter_mode in ENCOUNTER_MODES:
+        row = time_encounter_mode(encounter_mode, occupancy, n_arrivals)
+        print(f"{row['encounter_mode']:>10} {row['events']:>10} events "
+              f"{1e6 * row['seconds'] / n_arrivals:>10.1f}us per arrival")
+
+
+def generate_city(n_people, seed=0):
+    env = Env(START_TIME, seed=seed)
+    return env, City.generate(env, n_people, **CITY)
+
+
+def time_city(n_people):
+    start_time = time.perf_counter()
+    generate_city(n_people)
+    return {'seconds': time.perf_counter() - start_time, 'count': n_people, 'unit': 'humans'}
+
+
+def time_preferences(n_people):
+    _, city = generate_city(n_people)
+    start_time = time.perf_counter()
+    city._compute_preferences()
+    return {'seconds': time.perf_counter() - start_time, 'count': len(city.households), 'unit': 'households'}
+
+
+def time_day(n_people, engine):
+    from run import simulate
+    start_time = time.perf_counter()
+    env, _ = simulate(n_people=n_people, simulation_days=1, engine=engine, seed=0, **CITY)
+    return {'seconds': time.perf_counter() - start_time, 'count': len(env.event_log), 'unit': 'events'}
+
+
+def time_select_location(n_people, n_calls=20000):
+    _, city = generate_city(n_people)
+    humans = [city.humans[i] for i in range(min(n_people, n_calls))]
+    location_types = ['stores', 'park', 'miscs']
+    start_time = time.perf_counter()
+    for i in range(n_calls):
+        humans[i % len(humans)]._select_location(location_types[i % 3], city)
+    return {'seconds': time.perf_counter() - start_time, 'count': n_calls, 'unit': 'calls'}
+
+
+def time_dump(n_people):
+    from run import simulate
+    _, monitors = simulate(n_people=n_people, simulation_days=1, engine='vectorized', seed=0, **CITY)
+    with tempfile.TemporaryDirectory() as directory:
+        start_time = time.perf_counter()
+        monitors[0].dump(os.path.join(directory, 'events'))
+        seconds = time.perf_counter() - start_time
+    return {'seconds': seconds, 'count': len(monitors[0].data), 'unit': 'events'}
+
+
+def time_minimax(n_nodes, density=0.08):
+    graph = random_contact_graph(n_nodes, density, seed=0)
+    start_time = time.perf_counter()
+    graph.node_to_vaccinate_alternate()
+    return {'seconds': time.perf_counter() - start_time, 'count': graph.search_stats.nodes_expanded,
+            'unit': 'nodes'}
+
+
+BENCHMARKS = {
+    'city': time_city,
+    'preferences': time_preferences,
+    'day': time_day,
+    'select_location': time_select_location,
+    'dump': time_dump,
+    'minimax': time_minimax,
+}
+
+
+def peak_memory_mb():
+    """ peak resident memory of the process in MB, None on Windows, which has no resource module """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 1024
+
+
+def measure(name, params):
+    """ row of the results of the benchmark name, the peak memory being the one of the whole process """
+    row = dict(benchmark=name, **params)
+    row.update(BENCHMARKS[name](**params))
+    row['per_second'] = row['count'] / row['seconds']
+    row['peak_mb'] = peak_memory_mb()
+    return row
+
+
+def run_suite(jobs):
+    """ runs the (name, params) jobs one after the other, each in a new process so that its peak memory is its own """
+    rows = []
+    for name, params in jobs:
+        # a pool per job rather than max_tasks_per_child=1, which needs Python 3.11
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            rows.append(executor.submit(measure, name, params).result())
+    return rows
+
+
+def suite_jobs(sizes, engines, graph_sizes):
+    jobs = []
+    for n_people in sizes:
+        jobs.append(('city', {'n_people': n_people}))
+        jobs.append(('preferences', {'n_people': n_people}))
+        jobs.extend(('day', {'n_people': n_people, 'engine': engine}) for engine in engines)
+        jobs.append(('dump', {'n_people': n_people}))
+    jobs.append(('select_location', {'n_people': sizes[0]}))
+    jobs.extend(('minimax', {'n_nodes': n_nodes}) for n_nodes in graph_sizes)
+    return jobs
+
+
+# columns of a row which are not parameters of its benchmark
+MEASURES = ('benchmark', 'seconds', 'count', 'unit', 'per_second', 'peak_mb', 'ratio', 'regression')
+
+
+def _params(row):
+    return ' '.join(f'{k}={v}' for k, v in row.items() if k not in MEASURES)
+
+
+def _key(row):
+    return row['benchmark'], _params(row)
+
+
+def compare(baseline, results, threshold=1.2):
+    """ rows of the results with their time relative to the same benchmark in baseline """
+    baseline = {_key(row): row for row in baseline}
+    rows = []
+    for row in results:
+        before = baseline.get(_key(row))
+        if before is not None:
+            ratio = row['seconds'] / before['seconds']
+            rows.append(dict(row, ratio=ratio, regression=ratio > threshold))
+    return rows
+
+
+def _ints(value):
+    return [int(v) for v in value.split(',')]
+
+
+@bench.command()
+@click.option('--sizes', help='populations of the cities, comma separated', default='1000,10000,100000')
+@click.option('--engine', 'engines', help='engine of the simulated days, can be repeated (default: all)',
+              multiple=True, type=click.Choice(['simpy', 'vectorized']))
+@click.option('--graph_sizes', help='numbers of nodes of the minimax graphs, comma separated', default='20,30,40,50')
+@click.option('--outfile', help='filename of the results (file format: .json)', type=str, required=False)
+def suite(sizes='1000,10000,100000', engines=(), graph_sizes='20,30,40,50', outfile=None):
+    """wall time, throughput and peak memory of city generation, simulated days, event dumps and minimax search"""
+    results = run_suite(suite_jobs(_ints(sizes), list(engines) or ['simpy', 'vectorized'], _ints(graph_sizes)))
+    for row in results:
+        peak = '' if row['peak_mb'] is None else f"{row['peak_mb']:>8.0f}MB"
+        print(f"{row['benchmark']:>16} {_params(row):<32} {row['seconds']:>10.3f}s {row['per_second']:>12.0f} "
+              f"{row['unit']}/s {peak}")
+    if outfile is not None:
+        with open(outfile, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+@bench.command(name='compare')
+@click.argument('baseline', type=click.File())
+@click.argument('results', type=click.File())
+@click.option('--threshold', help='time ratio above which a benchmark is a regression', type=float, default=1.2)
+def compare_results(baseline, results, threshold=1.2):
+    """times of the RESULTS of a suite relative to the ones of BASELINE, fails on regressions"""
+    rows = compare(json.load(baseline), json.load(results), threshold=threshold)
+    for row in rows:
+        regression = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['benchmark']:>16} {_params(row):<32} {row['ratio']:>6.2f}x{regression}")
+    if any(row['regression'] for row in rows):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    bench()
@@ -38,3 +38,13 @@ AVG_SCALE_MISC_MINUTES = 15
 SCALE_SCALE_MISC_MINUTES = 5
 
 WORK_FROM_HOME = False
+
+# CONTAMINATION
+## when True, each sick human at a location is an independent chance cont_prob of contamination
+DOSE_DEPENDENT_CONTAMINATION = False  # @param
+
+# ENCOUNTERS
+## 'pairs': one encounter event per pair, 'batched': same events with the distances of an arrival drawn at once,
+## 'aggregate': contact counts and exposure per location and time bucket instead of pair events
+ENCOUNTER_MODE = 'pairs'  # @param ['pairs', 'batched', 'aggregate']
+CONTACT_BUCKET_MINUTES = 60  # @param
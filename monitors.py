@@ -1,11 +1,13 @@
 from config import TICK_MINUTE
-from simulator import City, Human
+from simulator import City, Human, EventSink, EventReader
 from matplotlib import pyplot as plt
 import json
 import pylab as pl
 import pickle
+import time
 from IPython import display
 
+from profiling import Profiler
 from utils import _json_serialize
 
 
@@ -127,12 +129,19 @@ class LatLonMonitor(BaseMonitor):
 
 class EventMonitor(BaseMonitor):
 
+    def __init__(self, f=None):
+        super().__init__(f)
+        # set by run, a monitor which did not run dumps no events
+        self.city = None
+
     def run(self, env, city: City):
+        # events are kept in env.event_log and only converted to dicts when dumped
+        self.city = city
         while True:
-            self.data = city.events
             yield env.timeout(self.f / TICK_MINUTE)
 
     def dump(self, dest: str = None):
+        self.data = self.city.events if self.city is not None else []
         if dest is None:
             print(json.dumps(self.data, indent=1, default=_json_serialize))
             return
@@ -141,6 +150,86 @@ class EventMonitor(BaseMonitor):
             pickle.dump(self.data, f)
 
 
+class StreamingEventMonitor(BaseMonitor):
+    """ streams the events to {dest}.events while the simulation runs, flushing at least every f minutes.
+    a resumed simulation continues the file from offset. """
+
+    def __init__(self, f=None, dest=None, batch_size=65536, offset=0):
+        super().__init__(f)
+        self.sink = EventSink(f"{dest}.events", batch_size=batch_size, offset=offset)
+
+    def run(self, env, city: City):
+        self.event_log = env.event_log
+        self.event_log.stream_to(self.sink)
+        while True:
+            yield env.timeout(self.f / TICK_MINUTE)
+            self.event_log.flush()
+
+    def dump(self, dest: str = None):
+        self.event_log.flush()
+        self.sink.close()
+        self.data = EventReader(self.sink.path)
+
+
+class ProfileMonitor(BaseMonitor):
+    """ times the hot paths of the simulation with a Profiler and samples every f minutes the wall time, the SimPy
+    events processed and the size of the event log. dump writes the report to {dest}.profile.json """
+
+    def __init__(self, f=None):
+        super().__init__(f)
+        self.profiler = Profiler()
+
+    def run(self, env, city: City):
+        # installed when the process is created, before the first step of env
+        self.env = env
+        self.n_agents = len(city.humans)
+        self.profiler.install(env)
+        self.start_time = time.perf_counter()
+        return self._sample(env)
+
+    def _sample(self, env):
+        while True:
+            self.data.append(self.sample())
+            yield env.timeout(self.f / TICK_MINUTE)
+
+    def sample(self):
+        return {
+            'time': self.env.now,
+            'wall_seconds': time.perf_counter() - self.start_time,
+            'simpy_events': self.profiler.calls['Env.step'],
+            'events': len(self.env.event_log),
+            'event_log_bytes': self.env.event_log.nbytes,
+        }
+
+    def report(self):
+        last = self.data[-1]
+        wall_seconds = last['wall_seconds']
+        simulated_hours = last['time'] * TICK_MINUTE / 60
+        return {
+            'agents': self.n_agents,
+            'simulated_hours': simulated_hours,
+            'wall_seconds': wall_seconds,
+            'simpy_events': last['simpy_events'],
+            'simpy_events_per_second': last['simpy_events'] / wall_seconds,
+            'agent_hours_per_second': self.n_agents * simulated_hours / wall_seconds,
+            'events': last['events'],
+            'events_per_second': last['events'] / wall_seconds,
+            'functions': self.profiler.report(),
+            'samples': self.data,
+        }
+
+    def dump(self, dest: str = None):
+        self.profiler.uninstall()
+        self.data.append(self.sample())
+        report = self.report()
+        if dest is None:
+            print(json.dumps(report, indent=1))
+            return
+
+        with open(f"{dest}.profile.json", 'w') as f:
+            json.dump(report, f, indent=1)
+
+
 class TimeMonitor(BaseMonitor):
 
     def run(self, env, city: City):
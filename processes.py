@@ -0,0 +1,219 @@
+import heapq
+
+import numpy as np
+import simpy
+
+from config import *  # PARAMETERS
+from simulator import City, Population
+
+
+def _event_queue(env):
+    """
+    the pending events of env, as the (time, priority, event id, event) entries of the heap of simpy.Environment.
+    checkpoints read and rewrite this private queue, so its shape is checked against the one of the simpy versions
+    supported (see requirements.txt).
+    """
+    queue = env._queue
+    for entry in queue:
+        if not (isinstance(entry, tuple) and len(entry) == 4 and isinstance(entry[3], simpy.events.Event)):
+            raise RuntimeError(f'Unsupported simpy {simpy.__version__}: unknown entry of the event queue {entry!r}')
+    return queue
+
+
+class ProcessSimulation(object):
+    """
+    Runs the SimPy engine: one process per Human of the city, following Human.run. The processes are generators,
+    which cannot be saved, but what each of them is doing at a time is: the activity it is in (the name of the
+    generator run waits for), the stay it is in or the Request it waits for, and the rank of the timeout ending the
+    stay among the pending events of env. checkpoint saves that next to the state of the city and of the humans, and
+    restore rebuilds the processes with Human.resume and puts the pending events back in the same order, so that a
+    restored simulation goes on event for event like an uninterrupted one.
+    """
+    # the generators of Human run waits for
+    activities = ('stay_at_home', 'go_to_work', 'shop', 'exercise', 'take_a_trip')
+
+    def __init__(self, env, city):
+        if not isinstance(city.humans, Population):
+            raise ValueError('ProcessSimulation needs a city of City.generate')
+        self.env = env
+        self.city = city
+        self.population = city.humans
+        # LocationArrays by the location_type of their Locations
+        self.locations = {locations.location_type: locations for locations in (
+            city.stores, city.parks, city.miscs, self.population.households, self.population.workplaces)}
+        # run processes of the humans, None for the ones over, and of the monitors
+        self.processes = []
+        self.monitor_processes = []
+
+    def start(self, monitors=()):
+        """ starts the process of every human, then the ones of the monitors """
+        for human in self.population:
+            self.processes.append(self.env.process(human.run(city=self.city)))
+        self.start_monitors(monitors)
+
+    def start_monitors(self, monitors):
+        for m in monitors:
+            self.monitor_processes.append(self.env.process(m.run(self.env, city=self.city)))
+
+    def run(self, until, checkpoint_every=None, on_checkpoint=None):
+        """
+        runs env up to the tick until. every checkpoint_every hours, and at until, on_checkpoint is called with the
+        state of the simulation.
+        """
+        if checkpoint_every:
+            ticks_per_hour = 60 / TICK_MINUTE
+            hour = (int(self.env.now // ticks_per_hour) // checkpoint_every + 1) * checkpoint_every
+            while hour * ticks_per_hour <= until:
+                self.env.run(until=hour * ticks_per_hour)
+                on_checkpoint(self.checkpoint())
+                hour += checkpoint_every
+        if until > self.env.now:
+            self.env.run(until=until)
+
+    @staticmethod
+    def location_index(location):
+        return location.location_type, location.index
+
+    def get_location(self, index):
+        location_type, i = index
+        return self.locations[location_type][i]
+
+    def checkpoint(self):
+        """
+        state of the simulation between two events: the city, the humans and their processes, their visits, the
+        humans present at and queuing for the locations, the event log (up to the offset of its sink) and the states
+        of the random generators. see restore.
+        """
+        env = self.env
+        # pending events in the order env processes them, its queue holds (time, priority, event id, event)
+        queue = sorted(_event_queue(env), key=lambda entry: entry[:3])
+        ranks = {id(entry[3]): rank for rank, entry in enumerate(queue)}
+
+        humans = list(self.population)
+        agents = {id(human): i for i, human in enumerate(humans)}
+        activity = np.full(len(humans), -1, dtype=np.int8)
+        rank = np.full(len(humans), -1, dtype=np.int64)
+        wake = np.full(len(humans), np.nan)
+        # requests are made by the processes of the activities, or by restore for the run processes
+        requesters = {}
+        for i, process in enumerate(self.processes):
+            if process is None or not process.is_alive:
+                continue
+            requesters[id(process)] = i
+            # the process of the activity is in a stay, a process of at waiting for a timeout, or waits for a Request
+            activity_process = process.target
+            activity[i] = self.activities.index(activity_process.name)
+            requesters[id(activity_process)] = i
+            if not isinstance(activity_process.target, simpy.resources.resource.Request):
+                timeout = activity_process.target.target
+                rank[i] = ranks[id(timeout)]
+                wake[i] = queue[rank[i]][0]
+
+        present = []
+        for locations in self.locations.values():
+            for location in locations.built():
+                if location.humans or location.users or location.queue:
+                    present.append({
+                        'location': self.location_index(location),
+                        'humans': [agents[id(human)] for human in location.humans],
+                        'users': [requesters[id(request.proc)] for request in location.users],
+                        'queue': [requesters[id(request.proc)] for request in location.queue],
+                    })
+
+        return {
+            'now': env.now,
+            'n_pending': len(queue),
+            'city': self.city.get_state(),
+            'humans': {
+                'infection_time': np.array([np.nan if h.infection_time is None else h.infection_time for h in humans]),
+                'location': [self.location_index(h.location) for h in humans],
+                'action': np.array([h.action for h in humans], dtype=np.int8),
+                # set by the first stay, location choice and trip of a human
+                'start_time': np.array([getattr(h, 'start_time', np.nan) for h in humans]),
+                'leaving_time': np.array([getattr(h, 'leaving_time', np.nan) for h in humans]),
+                'adjust_gamma': np.array([getattr(h, 'adjust_gamma', np.nan) for h in humans]),
+                'trip_stops': np.array([getattr(h, 'trip_stops', 0) for h in humans], dtype=np.int64),
+                'rng': [None if h._rng is None else h._rng.bit_generator.state for h in humans],
+                'gaussians': [None if h._gaussians is None else h._gaussians.get_state() for h in humans],
+            },
+            'processes': {'activity': activity, 'rank': rank, 'wake': wake},
+            'present': present,
+            'monitors': [ranks.get(id(process.target)) for process in self.monitor_processes],
+            'event_log': env.event_log.get_state(self.location_index),
+            'random': env.rng.get_state(),
+        }
+
+    @classmethod
+    def restore(cls, env, state, monitors=()):
+        """
+        simulation of a checkpoint, on a new env, whose monitors are replayed like in VectorizedSimulation.restore.
+        the processes of the humans are then rebuilt, and the pending events of the checkpoint, the timeouts of the
+        stays and of the monitors, are put back in the queue in their order. monitors beyond the ones of the
+        checkpointed run come after them at equal times.
+        """
+        city = City.from_state(env, state['city'])
+        simulation = cls(env, city)
+
+        simulation.start_monitors(monitors)
+        if state['now'] > env.now:
+            env.run(until=state['now'])
+        env.event_log.set_state(state['event_log'], simulation.get_location)
+        env.rng.set_state(state['random'])
+
+        saved = state['humans']
+        humans = list(simulation.population)
+        for i, human in enumerate(humans):
+            infection_time = saved['infection_time'][i]
+            human.infection_time = None if np.isnan(infection_time) else infection_time.item()
+            human.location = simulation.get_location(saved['location'][i])
+            human.action = saved['action'][i].item()
+            for name in ('start_time', 'leaving_time', 'adjust_gamma'):
+                if not np.isnan(saved[name][i]):
+                    setattr(human, name, saved[name][i].item())
+            human.trip_stops = saved['trip_stops'][i].item()
+            if saved['rng'][i] is not None:
+                human.rng.bit_generator.state = saved['rng'][i]
+            if saved['gaussians'][i] is not None:
+                human.gaussians.set_state(saved['gaussians'][i])
+
+        requests = {}
+        for entry in state['present']:
+            location = simulation.get_location(entry['location'])
+            for i in entry['humans']:
+                location.add_human(humans[i])
+            # the users first, who get the capacity back, then the queue in its order
+            for i in entry['users'] + entry['queue']:
+                requests[i] = location.request()
+
+        processes = state['processes']
+        pending = {}
+        for i, human in enumerate(humans):
+            if processes['activity'][i] < 0:
+                simulation.processes.append(None)
+                continue
+            stay = None
+            if processes['rank'][i] >= 0:
+                wake = processes['wake'][i].item()
+                stay = (human.location, env.timeout(max(wake - env.now, 0)))
+                pending[id(stay[1])] = (wake, processes['rank'][i].item())
+            request = requests.get(i)
+            process = env.process(human.resume(city, cls.activities[processes['activity'][i]], stay=stay,
+                                               request=request))
+            if request is not None:
+                request.proc = process
+            simulation.processes.append(process)
+
+        for process, rank in zip(simulation.monitor_processes, state['monitors']):
+            if rank is not None:
+                pending[id(process.target)] = (None, rank)
+        # restored events come before the ones scheduled from now on at equal times and priorities, like they did
+        # in the checkpointed run
+        queue = []
+        for time, priority, eid, event in _event_queue(env):
+            if id(event) in pending:
+                wake, rank = pending[id(event)]
+                time, eid = time if wake is None else wake, rank - state['n_pending']
+            queue.append((time, priority, eid, event))
+        heapq.heapify(queue)
+        env._queue[:] = queue
+        return simulation
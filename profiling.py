@@ -0,0 +1,75 @@
+import functools
+import time
+
+from simulator import Human
+from utils import TruncatedGaussianPool
+from vectorized import VectorizedSimulation
+
+# (owner, name) of the functions timed by a Profiler, on top of the steps of env
+HOT_PATHS = [
+    (Human, '_select_location'),
+    (Human, '_choose_location'),
+    (Human, 'encounter'),
+    (TruncatedGaussianPool, 'draw'),
+    (VectorizedSimulation, 'step'),
+    (VectorizedSimulation, 'choose_location'),
+    (VectorizedSimulation, 'resolve'),
+]
+
+
+class Profiler(object):
+    """
+    Call counts and cumulative wall time of the hot paths of a simulation, and of Env.step, which processes one SimPy
+    event. The functions are only wrapped between install and uninstall, a simulation which is not profiled runs the
+    plain functions. Times are inclusive: the time of Env.step contains the one of the functions called by the
+    processes it resumes.
+    """
+
+    def __init__(self, hot_paths=HOT_PATHS):
+        self.hot_paths = hot_paths
+        self.calls = {}
+        self.seconds = {}
+        self._installed = []
+
+    def install(self, env):
+        for owner, name in self.hot_paths:
+            self._wrap(owner, name, f'{owner.__name__}.{name}')
+        self._wrap(env, 'step', 'Env.step')
+
+    def uninstall(self):
+        for owner, name, original in reversed(self._installed):
+            if original is None:
+                # a method of the instance env
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._installed = []
+
+    def _wrap(self, owner, name, key):
+        original = vars(owner).get(name)
+        is_static = isinstance(original, staticmethod)
+        function = original.__func__ if is_static else getattr(owner, name)
+        calls, seconds = self.calls, self.seconds
+        calls[key] = 0
+        seconds[key] = 0.
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[key] += 1
+                seconds[key] += time.perf_counter() - start
+
+        setattr(owner, name, staticmethod(timed) if is_static else timed)
+        self._installed.append((owner, name, original))
+
+    def report(self):
+        return {
+            key: {
+                'calls': self.calls[key],
+                'seconds': self.seconds[key],
+                'us_per_call': 1e6 * self.seconds[key] / self.calls[key] if self.calls[key] else 0,
+            } for key in self.calls
+        }
@@ -1,10 +1,18 @@
-from monitors import EventMonitor, TimeMonitor
+from monitors import EventMonitor, ProfileMonitor, StreamingEventMonitor, TimeMonitor
 from simulator import *
-from utils import _draw_random_discreet_gaussian
+from processes import ProcessSimulation
+from vectorized import VectorizedSimulation
+from benchmarks import bench
+from utils import _dump_rows
 import datetime
+import os
+import pickle
 import click
 
 
+ENGINES = ['simpy', 'vectorized']
+
+
 @click.group()
 def simu():
     pass
@@ -19,19 +27,47 @@ def simu():
 @click.option('--simulation_days', help='number of days to run the simulation for', type=int, default=30)
 @click.option('--outfile', help='filename of the output (file format: .pkl)', type=str, required=False)
 @click.option('--print_progress', is_flag=True, help='print the evolution of days', default=False)
+@click.option('--stream_events', is_flag=True, default=False,
+              help='write the events to {outfile}.events while simulating instead of keeping them in memory')
+@click.option('--encounter_mode', type=click.Choice(ENCOUNTER_MODES), default=None,
+              help='pair events, pair events drawn in batches or aggregated contacts per location and time bucket '
+                   '(default: ENCOUNTER_MODE of config.py)')
+@click.option('--engine', type=click.Choice(ENGINES), default='simpy',
+              help='one SimPy process per human, or hourly steps of the whole population on arrays')
+@click.option('--checkpoint_days', type=float, default=None,
+              help='save the state to {outfile}.ckpt every so many simulated days')
+@click.option('--seed', type=int, default=None, help='seed of the random streams, the same seed gives the same run')
+@click.option('--profile', is_flag=True, default=False,
+              help='time the hot paths of the simulation and write the report to {outfile}.profile.json')
 def sim(n_stores=None, n_people=None, n_parks=None, n_misc=None,
         init_percent_sick=0, store_capacity=30, misc_capacity=30,
         start_time=datetime.datetime(2020, 2, 28, 0, 0),
         simulation_days=10,
         outfile=None,
-        print_progress=False):
+        print_progress=False,
+        stream_events=False,
+        encounter_mode=None,
+        engine='simpy',
+        checkpoint_days=None,
+        seed=None,
+        profile=False):
+    if stream_events and outfile is None:
+        raise click.UsageError('--stream_events needs an --outfile')
+    if checkpoint_days and outfile is None:
+        raise click.UsageError('--checkpoint_days needs an --outfile')
     run_simu(
         n_stores=n_stores, n_people=n_people, n_parks=n_parks, n_misc=n_misc,
         init_percent_sick=init_percent_sick, store_capacity=store_capacity, misc_capacity=misc_capacity,
         start_time=start_time,
         simulation_days=simulation_days,
         outfile=outfile,
-        print_progress=print_progress
+        print_progress=print_progress,
+        stream_events=stream_events,
+        encounter_mode=encounter_mode,
+        engine=engine,
+        checkpoint_days=checkpoint_days,
+        seed=seed,
+        profile=profile
     )
 
 
@@ -40,89 +76,143 @@ def run_simu(n_stores=None, n_people=None, n_parks=None, n_misc=None,
              start_time=datetime.datetime(2020, 2, 28, 0, 0),
              simulation_days=10,
              outfile=None,
-             print_progress=False):
-    env = Env(start_time)
-    city_limit = ((0, 1000), (0, 1000))
-    stores = [
-        Location(
-            env,
-            capacity=_draw_random_discreet_gaussian(store_capacity, int(0.5 * store_capacity)),
-            cont_prob=0.1,
-            location_type='store',
-            name=f'store{i}',
-            lat=random.randint(*city_limit[0]),
-            lon=random.randint(*city_limit[1]),
-        )
-        for i in range(n_stores)]
-    parks = [
-        Location(
-            env, cont_prob=0.02,
-            name=f'park{i}',
-            location_type='park',
-            lat=random.randint(*city_limit[0]),
-            lon=random.randint(*city_limit[1])
-        )
-        for i in range(n_parks)
-    ]
-    households = [
-        Location(
-            env, cont_prob=1,
-            name=f'household{i}',
-            location_type='household',
-            lat=random.randint(*city_limit[0]),
-            lon=random.randint(*city_limit[1]),
-        )
-        for i in range(int(n_people / 2))
-    ]
-    workplaces = [
-        Location(
-            env, cont_prob=1,
-            name=f'workplace{i}',
-            location_type='workplace',
-            lat=random.randint(*city_limit[0]),
-            lon=random.randint(*city_limit[1]),
-        )
-        for i in range(int(n_people / 30))
-    ]
-    miscs = [
-        Location(
-            env, cont_prob=1,
-            capacity=_draw_random_discreet_gaussian(misc_capacity, int(0.5 * misc_capacity)),
-            name=f'misc{i}',
-            location_type='misc',
-            lat=random.randint(*city_limit[0]),
-            lon=random.randint(*city_limit[1])
-        ) for i in range(n_misc)
-    ]
-
-    humans = [
-        Human(
-            env=env,
-            name=i,
-            infection_timestamp=start_time if i < n_people * init_percent_sick else None,
-            household=np.random.choice(households),
-            workplace=np.random.choice(workplaces)
-        )
-        for i in range(n_people)]
-
-    city = City(stores=stores, parks=parks, humans=humans, miscs=miscs)
-    monitors = [EventMonitor(f=120)]
+             print_progress=False,
+             stream_events=False,
+             encounter_mode=None,
+             engine='simpy',
+             checkpoint_days=None,
+             seed=None,
+             profile=False):
+    env, monitors = simulate(
+        n_stores=n_stores, n_people=n_people, n_parks=n_parks, n_misc=n_misc,
+        init_percent_sick=init_percent_sick, store_capacity=store_capacity, misc_capacity=misc_capacity,
+        start_time=start_time,
+        simulation_days=simulation_days,
+        outfile=outfile,
+        print_progress=print_progress,
+        stream_events=stream_events,
+        encounter_mode=encounter_mode,
+        engine=engine,
+        checkpoint_days=checkpoint_days,
+        seed=seed,
+        profile=profile
+    )
+    # the profile ends with the simulation, before the events are written
+    for m in monitors[1:]:
+        m.dump(outfile)
+    monitors[0].dump(outfile)
+    return monitors[0].data
+
+
+def simulate(n_stores=None, n_people=None, n_parks=None, n_misc=None,
+             init_percent_sick=0, store_capacity=30, misc_capacity=30,
+             start_time=datetime.datetime(2020, 2, 28, 0, 0),
+             simulation_days=10,
+             outfile=None,
+             print_progress=False,
+             stream_events=False,
+             encounter_mode=None,
+             engine='simpy',
+             checkpoint_days=None,
+             seed=None,
+             profile=False):
+    """ builds a city and runs the simulation, returns the environment and the monitors, the events one first """
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine:{engine}')
+    env = Env(start_time, encounter_mode=encounter_mode, seed=seed)
+    city = City.generate(env, n_people=n_people, n_stores=n_stores, n_parks=n_parks, n_misc=n_misc,
+                         init_percent_sick=init_percent_sick, store_capacity=store_capacity,
+                         misc_capacity=misc_capacity)
+    monitors = [StreamingEventMonitor(f=120, dest=outfile) if stream_events else EventMonitor(f=120)]
 
     # run the simulation
     if print_progress:
         monitors.append(TimeMonitor(60))
+    if profile:
+        monitors.append(ProfileMonitor(60))
+
+    if engine == 'simpy':
+        simulation = ProcessSimulation(env, city)
+        simulation.start(monitors)
+    else:
+        for m in monitors:
+            env.process(m.run(env, city=city))
+        simulation = VectorizedSimulation(env, city)
+    params = dict(start_time=start_time, simulation_days=simulation_days, outfile=outfile,
+                  stream_events=stream_events, encounter_mode=env.encounter_mode, engine=engine,
+                  checkpoint_days=checkpoint_days, seed=env.rng.entropy)
+    simulation.run(
+        until=simulation_days * 24 * 60 / TICK_MINUTE,
+        checkpoint_every=checkpoint_days and max(1, round(checkpoint_days * 24)),
+        on_checkpoint=lambda state: save_checkpoint(f'{outfile}.ckpt', params, state),
+    )
+    return env, monitors
+
+
+def save_checkpoint(path, params, state):
+    """ writes the parameters of the run and the state of the simulation, replacing the previous checkpoint only
+    once the new one is complete """
+    with open(f'{path}.tmp', 'wb') as f:
+        pickle.dump({'params': params, 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{path}.tmp', path)
+
+
+def resume_simu(outfile, simulation_days=None, print_progress=False):
+    """ continues the run of the checkpoint {outfile}.ckpt, up to simulation_days if given """
+    with open(f'{outfile}.ckpt', 'rb') as f:
+        checkpoint = pickle.load(f)
+    params, state = checkpoint['params'], checkpoint['state']
+    if simulation_days is not None:
+        params['simulation_days'] = simulation_days
+
+    env = Env(params['start_time'], encounter_mode=params['encounter_mode'], seed=params['seed'])
+    if params['stream_events']:
+        monitors = [StreamingEventMonitor(f=120, dest=outfile, offset=state['event_log']['sink_offset'])]
+    else:
+        monitors = [EventMonitor(f=120)]
+    engine = ProcessSimulation if params['engine'] == 'simpy' else VectorizedSimulation
+    simulation = engine.restore(env, state, monitors=monitors)
+    if print_progress:
+        monitors.append(TimeMonitor(60))
+        env.process(monitors[-1].run(env, city=simulation.city))
 
-    for human in humans:
-        env.process(human.run(city=city))
-
-    for m in monitors:
-        env.process(m.run(env, city=city))
-    env.run(until=simulation_days * 24 * 60 / TICK_MINUTE)
-
+    checkpoint_days = params['checkpoint_days']
+    simulation.run(
+        until=params['simulation_days'] * 24 * 60 / TICK_MINUTE,
+        checkpoint_every=checkpoint_days and max(1, round(checkpoint_days * 24)),
+        on_checkpoint=lambda state: save_checkpoint(f'{outfile}.ckpt', params, state),
+    )
     monitors[0].dump(outfile)
     return monitors[0].data
 
 
+@simu.command()
+@click.option('--outfile', help='filename of the output of the run to resume, its checkpoint is {outfile}.ckpt',
+              type=str, required=True)
+@click.option('--simulation_days', help='number of days to run the simulation for (default: the one of the run)',
+              type=int, default=None)
+@click.option('--print_progress', is_flag=True, help='print the evolution of days', default=False)
+def resume(outfile=None, simulation_days=None, print_progress=False):
+    resume_simu(outfile, simulation_days=simulation_days, print_progress=print_progress)
+
+
+@simu.command()
+@click.option('--param', 'params', multiple=True,
+              help='NAME=v1,v2,... values of a sim option (n_people, ...) or of a config.py parameter, can be repeated')
+@click.option('--n_seeds', help='number of seeds of every combination of parameters', type=int, default=3)
+@click.option('--seed', help='first seed', type=int, default=0)
+@click.option('--workers', help='number of worker processes (default: one per core)', type=int, default=None)
+@click.option('--outfile', help='filename of the results table (file format: .csv or .json)', type=str,
+              required=False)
+def sweep(params=(), n_seeds=3, seed=0, workers=None, outfile=None):
+    from sweep import parse_grid, run_sweep
+    try:
+        grid = parse_grid(params)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--param')
+    _dump_rows(run_sweep(grid, seeds=range(seed, seed + n_seeds), workers=workers), outfile)
+
+
 @simu.command()
 def test():
     import unittest
@@ -134,5 +224,8 @@ def test():
     runner.run(suite)
 
 
+simu.add_command(bench)
+
+
 if __name__ == "__main__":
     simu()
@@ -1,21 +1,55 @@
 # -*- coding: utf-8 -*-
 import simpy
-import random
+import sys
+from collections import namedtuple, OrderedDict
+from array import array
 
 import itertools
 import numpy as np
-from collections import defaultdict
 import datetime
+import pickle
+import struct
 
-from utils import _normalize_scores, _draw_random_discreet_gaussian
+from utils import _normalize_scores, AliasTable, FenwickTree, RandomStreams, TruncatedGaussianPool
 from config import *  # PARAMETERS
 
 
+ENCOUNTER_MODES = ['pairs', 'batched', 'aggregate']
+# location_type of the Locations of each type of location of a city
+LOCATION_TYPES = {'stores': 'store', 'parks': 'park', 'miscs': 'misc', 'households': 'household',
+                  'workplaces': 'workplace'}
+# type, index and coordinates of a location, enough to choose a location from it without building its Location
+LocationStub = namedtuple('LocationStub', ['location_type', 'index', 'lat', 'lon'])
+
+
+def ticks_per_day():
+    # read at every call, TICK_MINUTE may be overridden after import (see sweep.config_overrides)
+    return 24 * 60 / TICK_MINUTE
+
+
 class Env(simpy.Environment):
+    """
+    Simulation time is counted in ticks of TICK_MINUTE minutes. The calendar (minute, hour, day of week) is worked
+    out from the tick with integer arithmetic on the minutes elapsed since the midnight of the first day, datetimes
+    are only built by timestamp and when exporting events.
 
-    def __init__(self, initial_timestamp):
+    Every random draw of a simulation comes from the streams of rng, so that a seed reproduces it.
+    """
+
+    def __init__(self, initial_timestamp, encounter_mode=None, seed=None):
         super().__init__()
+        if encounter_mode is None:
+            encounter_mode = ENCOUNTER_MODE
+        if encounter_mode not in ENCOUNTER_MODES:
+            raise ValueError(f'Unknown encounter mode:{encounter_mode}')
         self.initial_timestamp = initial_timestamp
+        # calendar of the first tick
+        self.initial_minute = (initial_timestamp.hour * 60 + initial_timestamp.minute +
+                               (initial_timestamp.second + initial_timestamp.microsecond / 1e6) / 60)
+        self.initial_weekday = initial_timestamp.weekday()
+        self.encounter_mode = encounter_mode
+        self.rng = RandomStreams(seed)
+        self.event_log = EventLog(self)
 
     def time(self):
         return self.now
@@ -25,14 +59,18 @@ class Env(simpy.Environment):
         return self.initial_timestamp + datetime.timedelta(
             minutes=self.now * TICK_MINUTE)
 
+    def elapsed_minutes(self):
+        """ minutes since the midnight of the first day of the simulation """
+        return self.initial_minute + self.now * TICK_MINUTE
+
     def minutes(self):
-        return self.timestamp.minute
+        return int(self.elapsed_minutes()) % 60
 
     def hour_of_day(self):
-        return self.timestamp.hour
+        return int(self.elapsed_minutes() // 60) % 24
 
     def day_of_week(self):
-        return self.timestamp.weekday()
+        return (self.initial_weekday + int(self.elapsed_minutes() // (24 * 60))) % 7
 
     def is_weekend(self):
         return self.day_of_week() in [0, 6]
@@ -40,29 +78,169 @@ class Env(simpy.Environment):
     def time_of_day(self):
         return self.timestamp.isoformat()
 
+    def ticks_to_timestamps(self, ticks):
+        """ datetimes of an array of simulation times """
+        return ticks_to_timestamps(self.initial_timestamp, ticks)
+
 
 class City(object):
+    # number of preference rows and of alias tables kept, the least recently used ones are dropped first
+    preference_cache_size = 65536
 
-    def __init__(self, stores, parks, humans, miscs):
+    def __init__(self, stores, parks, humans, miscs, env=None):
+        self.env = env
         self.stores = stores
         self.parks = parks
         self.humans = humans
         self.miscs = miscs
+        for locations in (stores, parks, miscs):
+            if not isinstance(locations, LocationArray):
+                for i, location in enumerate(locations):
+                    location.index = i
+        self._miscs_preferences = OrderedDict()
+        self._preference_samplers = OrderedDict()
         self._compute_preferences()
 
+    @classmethod
+    def generate(cls, env, n_people, n_stores, n_parks, n_misc, init_percent_sick=0, store_capacity=30,
+                 misc_capacity=30, city_limit=((0, 1000), (0, 1000))):
+        """ draws a city in one pass over NumPy arrays, its locations are LocationArrays and its humans a Population """
+        rng = env.rng.component('city')
+        gaussians = env.rng.gaussians('city')
+
+        def locations(location_type, n, cont_prob, capacity=None):
+            return LocationArray(env, location_type,
+                                 lat=rng.integers(city_limit[0][0], city_limit[0][1] + 1, n),
+                                 lon=rng.integers(city_limit[1][0], city_limit[1][1] + 1, n),
+                                 cont_prob=cont_prob, capacity=capacity)
+
+        def capacities(n, capacity):
+            return gaussians.draw_array(np.full(n, capacity), np.full(n, int(0.5 * capacity)))
+
+        stores = locations('store', n_stores, 0.1, capacities(n_stores, store_capacity))
+        parks = locations('park', n_parks, 0.02)
+        households = locations('household', int(n_people / 2), 1)
+        workplaces = locations('workplace', int(n_people / 30), 1)
+        miscs = locations('misc', n_misc, 1, capacities(n_misc, misc_capacity))
+        humans = Population.generate(env, n_people, households, workplaces, init_percent_sick=init_percent_sick)
+        return cls(stores=stores, parks=parks, humans=humans, miscs=miscs, env=env)
+
+    def get_state(self, population=None):
+        """ arrays of the locations and of the humans of the city, see from_state. population is the Population of
+        the humans, when they are a list """
+        population = self.humans if population is None else population
+        locations = {'stores': self.stores, 'parks': self.parks, 'miscs': self.miscs,
+                     'households': population.households, 'workplaces': population.workplaces}
+        return {
+            'locations': {location_type: self._location_arrays(l) for location_type, l in locations.items()},
+            'population': population.get_state(),
+        }
+
+    @staticmethod
+    def _location_arrays(locations):
+        if isinstance(locations, LocationArray):
+            return {'lat': locations.lat, 'lon': locations.lon, 'cont_prob': np.ascontiguousarray(locations.cont_prob),
+                    'capacity': None if locations.capacity is None else np.ascontiguousarray(locations.capacity)}
+        capacities = [location.capacity for location in locations]
+        return {
+            'lat': np.array([location.lat for location in locations]),
+            'lon': np.array([location.lon for location in locations]),
+            'cont_prob': np.array([location.cont_prob for location in locations], dtype=np.float64),
+            'capacity': None if all(c == float('inf') for c in capacities) else np.array(capacities),
+        }
+
+    @classmethod
+    def from_state(cls, env, state):
+        """ city of a state of get_state, on env. its locations are LocationArrays and its humans a Population """
+        locations = {location_type: LocationArray(env, LOCATION_TYPES[location_type], **arrays)
+                     for location_type, arrays in state['locations'].items()}
+        humans = Population.from_state(env, locations['households'], locations['workplaces'], state['population'])
+        return cls(stores=locations['stores'], parks=locations['parks'], humans=humans, miscs=locations['miscs'],
+                   env=env)
+
     @property
     def events(self):
-        return list(itertools.chain(*[h.events for h in self.humans]))
+        if self.env is None:
+            # the events of every human, in the order of the humans, from one pass over each event log
+            by_human = {}
+            for event_log in dict.fromkeys(h.env.event_log for h in self.humans):
+                for event in event_log.to_dicts():
+                    by_human.setdefault(event['human_id'], []).append(event)
+            return list(itertools.chain.from_iterable(by_human.get(h.name, ()) for h in self.humans))
+        return self.env.event_log.to_dicts()
 
     @staticmethod
     def compute_distance(loc1, loc2):
         return np.sqrt((loc1.lat - loc2.lat) ** 2 + (loc1.lon - loc2.lon) ** 2)
 
+    @staticmethod
+    def coordinates(locations):
+        """ float32 (lat, lon) rows of a list of locations or of a LocationArray """
+        if isinstance(locations, LocationArray):
+            return np.stack([locations.lat, locations.lon], axis=1).astype(np.float32)
+        return np.array([(l.lat, l.lon) for l in locations], dtype=np.float32).reshape(-1, 2)
+
+    @staticmethod
+    def compute_preference_matrix(sources, locations, chunk_size=65536):
+        """ inverse distance preference of every source for every location, as a float32 matrix
+        computed with broadcasting, chunk_size sources at a time to bound the temporaries."""
+        src = City.coordinates(sources)
+        dst = City.coordinates(locations)
+        preferences = np.empty((len(src), len(dst)), dtype=np.float32)
+        for start in range(0, len(src), chunk_size):
+            chunk = src[start:start + chunk_size]
+            distance = np.hypot(chunk[:, 0, None] - dst[None, :, 0], chunk[:, 1, None] - dst[None, :, 1])
+            preferences[start:start + chunk_size] = 1 / (distance + np.float32(1e-1))
+        return preferences
+
+    def _cached(self, cache, key, build):
+        """ value of key in the LRU cache, built on a miss """
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = build()
+            if len(cache) > self.preference_cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def miscs_preferences(self, location):
+        """ preferences for the non-essential establishments from the given location (a Location or a
+        LocationStub), aligned with self.miscs. trips only start from households and miscs, so rows are computed on
+        first use and cached by type and index of location. the location itself gets a zero preference."""
+        def build():
+            preferences = self.compute_preference_matrix([location], self.miscs)[0]
+            if location.location_type == 'misc':
+                preferences[location.index] = 0
+            return preferences
+
+        return self._cached(self._miscs_preferences, (location.location_type, location.index), build)
+
+    def preference_sampler(self, location_type, source):
+        """ alias table over the preferences for stores or parks of a household, or for miscs from a location,
+        built on first use and cached by type and index of source."""
+        def build():
+            if location_type == 'miscs':
+                return AliasTable(self.miscs_preferences(source))
+            elif location_type == 'stores':
+                return AliasTable(self.stores_preferences[source.index])
+            return AliasTable(self.parks_preferences[source.index])
+
+        return self._cached(self._preference_samplers, (location_type, source.location_type, source.index), build)
+
     def _compute_preferences(self):
-        """ compute preferred distribution of each human for park, stores, etc."""
-        for h in self.humans:
-            h.stores_preferences = [(self.compute_distance(h.household, s) + 1e-1) ** -1 for s in self.stores]
-            h.parks_preferences = [(self.compute_distance(h.household, s) + 1e-1) ** -1 for s in self.parks]
+        """ compute preferred distribution of each human for park, stores, etc.
+        people of a household share its location, so preferences are computed once per household, in the row
+        household.index of the shared matrices. households of a list of humans are indexed in order of appearance."""
+        if isinstance(self.humans, Population):
+            households = self.humans.households
+        else:
+            households = list(dict.fromkeys(h.household for h in self.humans))
+            for i, household in enumerate(households):
+                household.index = i
+        self.households = households
+        self.stores_preferences = self.compute_preference_matrix(households, self.stores)
+        self.parks_preferences = self.compute_preference_matrix(households, self.parks)
 
 
 class Location(simpy.Resource):
@@ -70,124 +248,697 @@ class Location(simpy.Resource):
     def __init__(self, env, capacity=simpy.core.Infinity, name='Safeway', location_type='stores', lat=None, lon=None,
                  cont_prob=None):
         super().__init__(env, capacity)
-        self.humans = set()
+        # humans present, as the keys of a dict so that they are iterated in their order of arrival
+        self.humans = {}
+        # number of sick humans in humans, kept up to date by add_human, remove_human and Human.infect
+        self.n_sick = 0
         self.name = name
         self.lat = lat
         self.lon = lon
         self.location_type = location_type
         self.cont_prob = cont_prob
+        # position in the list of its type in the city
+        self.index = None
+
+    def add_human(self, human):
+        if human not in self.humans:
+            self.humans[human] = None
+            human.present_at.append(self)
+            self.n_sick += human.is_sick
+
+    def remove_human(self, human):
+        del self.humans[human]
+        human.present_at.remove(self)
+        self.n_sick -= human.is_sick
 
     def sick_human(self):
-        return any([h.is_sick for h in self.humans])
+        return self.n_sick > 0
 
     def __repr__(self):
         return f"{self.location_type}:{self.name} - Total number of people in {self.location_type}:{len(self.humans)} - sick:{self.sick_human()}"
 
     def contamination_proba(self):
-        if not self.sick_human():
+        if not self.n_sick:
             return 0
+        if DOSE_DEPENDENT_CONTAMINATION:
+            # every sick human is an independent chance of contamination
+            return 1 - (1 - self.cont_prob) ** self.n_sick
         return self.cont_prob
 
     def __hash__(self):
         return hash(self.name)
 
 
+class LocationArray(object):
+    """
+    Locations of a type held as arrays of coordinates, contamination probabilities and capacities. The Location of an
+    index is only built on its first access, so a city can hold millions of households for the cost of the arrays.
+    """
+
+    def __init__(self, env, location_type, lat, lon, cont_prob, capacity=None):
+        self.env = env
+        self.location_type = location_type
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.cont_prob = np.broadcast_to(np.asarray(cont_prob, dtype=np.float64), self.lat.shape)
+        self.capacity = None if capacity is None else np.broadcast_to(capacity, self.lat.shape)
+        self._locations = {}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __getitem__(self, i):
+        location = self._locations.get(i)
+        if location is None:
+            location = self._locations[i] = Location(
+                self.env,
+                capacity=simpy.core.Infinity if self.capacity is None else int(self.capacity[i]),
+                cont_prob=float(self.cont_prob[i]),
+                name=f'{self.location_type}{i}',
+                location_type=self.location_type,
+                lat=self.lat[i].item(),
+                lon=self.lon[i].item(),
+            )
+            location.index = i
+        return location
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def built(self):
+        """ the Locations built so far """
+        return list(self._locations.values())
+
+
 class Event:
     test = 'test'
     encounter = 'encounter'
     symptom_start = 'symptom_start'
     contamination = 'contamination'
+    contacts = 'contacts'
 
     @staticmethod
     def members():
-        return [Event.test, Event.encounter, Event.symptom_start, Event.contamination]
+        return [Event.test, Event.encounter, Event.symptom_start, Event.contamination, Event.contacts]
 
     @staticmethod
     def log_encounter(human1, human2, location, duration, distance, time):
-        human1.events.append(
-            {
-                'human_id': human1.name,
-                'time': time,
-                'event_type': Event.encounter,
-                'payload': {
-                    'encounter_human_id': human2.name,
-                    'duration': duration,
-                    'distance': distance,
-                    'lat': location.lat,
-                    'lon': location.lon,
-                }
-            }
-        )
-
-        human2.events.append(
-            {
-                'human_id': human2.name,
-                'time': time,
-                'event_type': Event.encounter,
-                'payload': {
-                    'encounter_human_id': human1.name,
-                    'duration': duration,
-                    'distance': distance,
-                    'lat': location.lat,
-                    'lon': location.lon,
-                }
-            }
-        )
+        human1.env.event_log.log_encounter(human1, human2, location, duration, distance, time)
 
     @staticmethod
     def log_test(human, result, time):
-        human.events.append(
-            {
-                'human_id': human.name,
-                'event_type': Event.test,
-                'time': time,
-                'payload': {
-                    'result': result,
-                }
-            }
-        )
+        human.env.event_log.log_test(human, result, time)
 
     @staticmethod
     def log_symptom_start(human, time, covid=True):
-        human.events.append(
-            {
-                'human_id': human.name,
-                'event_type': Event.symptom_start,
-                'time': time,
-                'payload': {
-                    'covid': covid
-                }
-            }
-        )
+        human.env.event_log.log_symptom_start(human, time, covid)
 
     @staticmethod
     def log_contaminate(human, time):
-        human.events.append(
-            {
-                'human_id': human.name,
-                'event_type': Event.contamination,
-                'time': time,
-                'payload': {}
-            }
-        )
+        human.env.event_log.log_contaminate(human, time)
+
+
+class EventTable(object):
+    """Append only table of typed columns, held in NumPy structured arrays allocated chunk_size rows at a time."""
+
+    def __init__(self, dtype, chunk_size=65536):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.n = chunk_size
+
+    def __len__(self):
+        return (len(self.chunks) - 1) * self.chunk_size + self.n if self.chunks else 0
+
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    def append(self, row):
+        if self.n == self.chunk_size:
+            self.chunks.append(np.empty(self.chunk_size, dtype=self.dtype))
+            self.n = 0
+        self.chunks[-1][self.n] = row
+        self.n += 1
+
+    def extend(self, rows):
+        """ appends a structured array of rows """
+        start = 0
+        while start < len(rows):
+            if self.n == self.chunk_size:
+                self.chunks.append(np.empty(self.chunk_size, dtype=self.dtype))
+                self.n = 0
+            size = min(self.chunk_size - self.n, len(rows) - start)
+            self.chunks[-1][self.n:self.n + size] = rows[start:start + size]
+            self.n += size
+            start += size
+
+    def to_array(self):
+        if not self.chunks:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(self.chunks[:-1] + [self.chunks[-1][:self.n]])
+
+    def take(self):
+        """ rows of the table, which is emptied """
+        rows = self.to_array()
+        self.chunks = []
+        self.n = self.chunk_size
+        return rows
+
+
+def ticks_to_timestamps(initial_timestamp, ticks):
+    """ datetimes of an array of simulation times """
+    minutes = np.asarray(ticks, dtype=np.float64) * TICK_MINUTE
+    return (np.datetime64(initial_timestamp, 'us') +
+            (minutes * 60e6).astype('timedelta64[us]')).astype(object).tolist()
+
+
+class EventLog(object):
+    """
+    Columnar store of the events of a simulation, one EventTable per event type. Humans and locations are stored
+    as integer ids and times as simulation ticks: an encounter takes one 28 bytes row instead of two nested dicts.
+    to_dicts rebuilds the list of dicts format on demand.
+
+    In the aggregate encounter mode, encounters are not stored: log_contacts adds them up per location and
+    CONTACT_BUCKET_MINUTES bucket, and the buckets go to the contacts table once the simulation moved past them. Rows
+    of the contacts table with the same location and bucket add up (a flush writes the current bucket as it is).
+
+    Once streaming to an EventSink, the tables are written out and emptied every batch_size rows of a type, so the
+    memory used no longer depends on the length of the run, and to_dicts only sees the events not written yet.
+    """
+    columns = {
+        Event.encounter: [('human_id', 'i4'), ('time', 'f8'), ('encounter_human_id', 'i4'), ('location_id', 'i4'),
+                          ('duration', 'f4'), ('distance', 'i4')],
+        Event.test: [('human_id', 'i4'), ('time', 'f8'), ('result', '?')],
+        Event.symptom_start: [('human_id', 'i4'), ('time', 'f8'), ('covid', '?')],
+        Event.contamination: [('human_id', 'i4'), ('time', 'f8')],
+        Event.contacts: [('time', 'f8'), ('location_id', 'i4'), ('contacts', 'i4'), ('exposure', 'f8')],
+    }
+    payload_columns = {
+        Event.test: 'result',
+        Event.symptom_start: 'covid',
+        Event.contamination: None,
+    }
+
+    def __init__(self, env, chunk_size=65536):
+        self.env = env
+        self.tables = {event_type: EventTable(dtype, chunk_size) for event_type, dtype in self.columns.items()}
+        self.location_ids = {}
+        self.locations = []
+        self.sink = None
+        self.n_flushed = 0
+        self.n_flushed_locations = 0
+        self.contacts_bucket = None
+        self.open_contacts = {}
+
+    def __len__(self):
+        # an encounter is an event for each of the two humans
+        return (self.n_flushed + sum(len(table) for table in self.tables.values()) + len(self.tables[Event.encounter]) +
+                len(self.open_contacts))
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables.values())
+
+    def location_id(self, location):
+        location_id = self.location_ids.get(location)
+        if location_id is None:
+            location_id = self.location_ids[location] = len(self.locations)
+            self.locations.append(location)
+        return location_id
+
+    def log_encounter(self, human1, human2, location, duration, distance, time):
+        self._append(Event.encounter, (human1.name, time, human2.name, self.location_id(location), duration, distance))
+
+    def log_encounters(self, human, others, location, durations, distances, time):
+        """ encounters of human with each of the humans of others, as a single block of rows """
+        rows = np.empty(len(others), dtype=self.tables[Event.encounter].dtype)
+        rows['human_id'] = human.name
+        rows['time'] = time
+        rows['encounter_human_id'] = [h.name for h in others]
+        rows['location_id'] = self.location_id(location)
+        rows['duration'] = durations
+        rows['distance'] = distances
+        self.extend(Event.encounter, rows)
+
+    def extend(self, event_type, rows):
+        """ appends a structured array of rows of the columns of event_type """
+        table = self.tables[event_type]
+        table.extend(rows)
+        if self.sink is not None and len(table) >= self.sink.batch_size:
+            self.flush()
+
+    def log_contacts(self, location, contacts, exposure, time):
+        """ adds contacts and their exposure to the bucket of time at location """
+        bucket_ticks = CONTACT_BUCKET_MINUTES / TICK_MINUTE
+        bucket = int(time // bucket_ticks) * bucket_ticks
+        if bucket != self.contacts_bucket:
+            self.close_contacts()
+            self.contacts_bucket = bucket
+        counts = self.open_contacts.get(location)
+        if counts is None:
+            counts = self.open_contacts[location] = [0, 0.]
+        counts[0] += contacts
+        counts[1] += exposure
+
+    def close_contacts(self):
+        """ moves the contacts of the current bucket to the contacts table """
+        open_contacts, self.open_contacts = self.open_contacts, {}
+        for location, (contacts, exposure) in open_contacts.items():
+            self._append(Event.contacts, (self.contacts_bucket, self.location_id(location), contacts, exposure))
+
+    def log_test(self, human, result, time):
+        self._append(Event.test, (human.name, time, result))
+
+    def log_symptom_start(self, human, time, covid=True):
+        self._append(Event.symptom_start, (human.name, time, covid))
+
+    def log_contaminate(self, human, time):
+        self._append(Event.contamination, (human.name, time))
+
+    def _append(self, event_type, row):
+        table = self.tables[event_type]
+        table.append(row)
+        if self.sink is not None and len(table) >= self.sink.batch_size:
+            self.flush()
+
+    def stream_to(self, sink):
+        self.sink = sink
+        if sink.file.tell() == 0:
+            sink.write({'initial_timestamp': self.env.initial_timestamp, 'tick_minute': TICK_MINUTE})
+
+    def flush(self):
+        """ writes the events logged since the last flush to the sink """
+        if self.sink is None:
+            return
+        self.close_contacts()
+        if len(self.locations) > self.n_flushed_locations:
+            self.sink.write(('locations', [(l.lat, l.lon) for l in self.locations[self.n_flushed_locations:]]))
+            self.n_flushed_locations = len(self.locations)
+        for event_type, table in self.tables.items():
+            if len(table):
+                rows = table.take()
+                self.n_flushed += 2 * len(rows) if event_type == Event.encounter else len(rows)
+                self.sink.write((event_type, rows))
+        self.sink.file.flush()
+
+    def get_state(self, location_index):
+        """ state of the log, locations being replaced by location_index(location), see set_state """
+        if self.sink is not None:
+            self.sink.file.flush()
+        return {
+            'tables': {event_type: table.to_array() for event_type, table in self.tables.items()},
+            'locations': [location_index(location) for location in self.locations],
+            'n_flushed': self.n_flushed,
+            'n_flushed_locations': self.n_flushed_locations,
+            'contacts_bucket': self.contacts_bucket,
+            'open_contacts': [(location_index(location), counts) for location, counts in self.open_contacts.items()],
+            'sink_offset': None if self.sink is None else self.sink.file.tell(),
+        }
+
+    def set_state(self, state, get_location):
+        """ restores a state of get_state on an empty log, get_location(index) giving back the locations """
+        for event_type, rows in state['tables'].items():
+            self.tables[event_type].extend(rows)
+        for index in state['locations']:
+            self.location_id(get_location(index))
+        self.n_flushed = state['n_flushed']
+        self.n_flushed_locations = state['n_flushed_locations']
+        self.contacts_bucket = state['contacts_bucket']
+        self.open_contacts = {get_location(index): list(counts) for index, counts in state['open_contacts']}
+
+    @staticmethod
+    def rows_to_dicts(event_type, rows, timestamps, lat, lon):
+        """ (human_id, time, event dict) of the rows of a table, an encounter yields one for each of the humans """
+        events = []
+        if event_type == Event.encounter:
+            for h1, h2 in (('human_id', 'encounter_human_id'), ('encounter_human_id', 'human_id')):
+                for h, t, timestamp, other, location_id, duration, distance in zip(
+                        rows[h1].tolist(), rows['time'].tolist(), timestamps, rows[h2].tolist(),
+                        rows['location_id'].tolist(), rows['duration'].tolist(), rows['distance'].tolist()):
+                    events.append((h, t, {
+                        'human_id': h,
+                        'time': timestamp,
+                        'event_type': Event.encounter,
+                        'payload': {
+                            'encounter_human_id': other,
+                            'duration': duration,
+                            'distance': distance,
+                            'lat': lat[location_id],
+                            'lon': lon[location_id],
+                        }
+                    }))
+            return events
+
+        if event_type == Event.contacts:
+            for t, timestamp, location_id, contacts, exposure in zip(
+                    rows['time'].tolist(), timestamps, rows['location_id'].tolist(), rows['contacts'].tolist(),
+                    rows['exposure'].tolist()):
+                events.append((None, t, {
+                    'human_id': None,
+                    'time': timestamp,
+                    'event_type': Event.contacts,
+                    'payload': {
+                        'contacts': contacts,
+                        'exposure': exposure,
+                        'lat': lat[location_id],
+                        'lon': lon[location_id],
+                    }
+                }))
+            return events
+
+        payload_key = EventLog.payload_columns[event_type]
+        payloads = rows[payload_key].tolist() if payload_key else [None] * len(rows)
+        for h, t, timestamp, value in zip(rows['human_id'].tolist(), rows['time'].tolist(), timestamps, payloads):
+            events.append((h, t, {
+                'human_id': h,
+                'event_type': event_type,
+                'time': timestamp,
+                'payload': {payload_key: value} if payload_key else {}
+            }))
+        return events
+
+    def to_dicts(self, human_id=None):
+        """
+        events in the list of dicts format, with datetimes, grouped by human and in time order within a human.
+        an encounter yields one event for each of the two humans. contacts, which belong to no human, come last in
+        time order.
+        """
+        events = []
+        contacts = self.tables[Event.contacts].to_array()
+        if self.open_contacts:
+            open_contacts = np.array([(self.contacts_bucket, self.location_id(location), n, exposure)
+                                      for location, (n, exposure) in self.open_contacts.items()], dtype=contacts.dtype)
+            contacts = np.concatenate([contacts, open_contacts])
+        lat = [l.lat for l in self.locations]
+        lon = [l.lon for l in self.locations]
+        for event_type, table in self.tables.items():
+            if event_type == Event.contacts:
+                continue
+            rows = table.to_array()
+            if human_id is not None:
+                keep = rows['human_id'] == human_id
+                if event_type == Event.encounter:
+                    keep |= rows['encounter_human_id'] == human_id
+                rows = rows[keep]
+            timestamps = self.env.ticks_to_timestamps(rows['time'])
+            events.extend(self.rows_to_dicts(event_type, rows, timestamps, lat, lon))
+
+        if human_id is not None:
+            events = [e for e in events if e[0] == human_id]
+        events.sort(key=lambda e: (e[0], e[1]))
+        if human_id is None:
+            contacts = contacts[np.argsort(contacts['time'], kind='stable')]
+            events.extend(self.rows_to_dicts(Event.contacts, contacts, self.env.ticks_to_timestamps(contacts['time']),
+                                             lat, lon))
+        return [e[2] for e in events]
+
+
+class EventSink(object):
+    """
+    Append only file of length prefixed pickle frames, written by EventLog.flush in batches of at most batch_size
+    rows of an event type. Frames are a header dict, ('locations', [(lat, lon), ...]) for newly seen locations and
+    (event_type, rows) for the rows of an EventTable. EventReader iterates the events back.
+    """
+
+    def __init__(self, path, batch_size=65536, offset=0):
+        self.path = path
+        self.batch_size = batch_size
+        if offset:
+            # resumes a file written up to offset
+            self.file = open(path, 'r+b')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        else:
+            self.file = open(path, 'wb')
+
+    def write(self, frame):
+        data = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(struct.pack('<Q', len(data)))
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+class EventReader(object):
+    """ iterates the events of an EventSink file as dicts, a batch at a time, in the order they were written """
+
+    def __init__(self, path):
+        self.path = path
+
+    def frames(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return
+                size, = struct.unpack('<Q', header)
+                data = f.read(size)
+                if len(data) < size:
+                    # last frame of a run which did not finish writing it
+                    return
+                yield pickle.loads(data)
+
+    def __iter__(self):
+        initial_timestamp = None
+        lat, lon = [], []
+        for frame in self.frames():
+            if isinstance(frame, dict):
+                initial_timestamp = frame['initial_timestamp']
+                continue
+            kind, content = frame
+            if kind == 'locations':
+                lat.extend(l[0] for l in content)
+                lon.extend(l[1] for l in content)
+                continue
+            timestamps = ticks_to_timestamps(initial_timestamp, content['time'])
+            for _, _, event in EventLog.rows_to_dicts(kind, content, timestamps, lat, lon):
+                yield event
 
 
-class Visits:
-    parks = defaultdict(int)
-    stores = defaultdict(int)
-    miscs = defaultdict(int)
+class VisitCounter(object):
+    """Visit counts of one human for one type of location. The visited locations are kept by Location.index in
+    order of first visit, next to a Fenwick tree of their counts: membership scans the few visited locations and a
+    location is drawn in proportion to its count in O(log n)."""
+
+    __slots__ = ('locations', 'counts')
+
+    def __init__(self):
+        self.locations = array('i')
+        self.counts = FenwickTree()
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, index):
+        return index in self.locations
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.locations) + self.counts.nbytes
+
+    def visit(self, index):
+        try:
+            slot = self.locations.index(index)
+        except ValueError:
+            self.locations.append(index)
+            self.counts.append(1)
+            return
+        self.counts.add(slot, 1)
+
+    def sample(self, u):
+        return self.locations[self.counts.sample(u)]
+
+
+class Visits(object):
+    """Visit history of one human. Counters are only created on the first visit of their type of location."""
+
+    __slots__ = ('parks', 'stores', 'miscs')
+
+    def __init__(self):
+        self.parks = None
+        self.stores = None
+        self.miscs = None
+
+    def counter(self, location_type):
+        counter = getattr(self, location_type)
+        if counter is None:
+            counter = VisitCounter()
+            setattr(self, location_type, counter)
+        return counter
+
+    @property
+    def nbytes(self):
+        """memory held by this visit history, in bytes"""
+        return sys.getsizeof(self) + sum(getattr(self, t).nbytes for t in self.__slots__ if getattr(self, t))
 
     @property
     def n_parks(self):
-        return len(self.parks)
+        return len(self.parks) if self.parks else 0
 
     @property
     def n_stores(self):
-        return len(self.stores)
+        return len(self.stores) if self.stores else 0
 
     @property
     def n_miscs(self):
-        return len(self.miscs)
+        return len(self.miscs) if self.miscs else 0
+
+
+class Population(object):
+    """
+    Humans of a city held as arrays: names, household and workplace indexes, infection ticks and the habits drawn by
+    Human, so a population is drawn in one pass. The Human of an index, which the SimPy engine needs, is only built on
+    its first access.
+    """
+
+    def __init__(self, env, households, workplaces, household, workplace, infection_time, habits, names=None,
+                 rho=0.3, gamma=0.21):
+        self.env = env
+        self.households = households
+        self.workplaces = workplaces
+        self.household = np.asarray(household)
+        self.workplace = np.asarray(workplace)
+        # tick of the infection, nan while healthy
+        self.infection_time = np.asarray(infection_time, dtype=np.float64)
+        self.habits = habits
+        self.names = np.arange(len(self.household)) if names is None else np.asarray(names)
+        self.rho = np.broadcast_to(np.asarray(rho, dtype=np.float64), self.household.shape)
+        self.gamma = np.broadcast_to(np.asarray(gamma, dtype=np.float64), self.household.shape)
+        self._humans = {}
+        self._visits = {}
+
+    @classmethod
+    def generate(cls, env, n_people, households, workplaces, init_percent_sick=0):
+        """ draws n_people humans living in random households and working in random workplaces """
+        n = n_people
+        sick = np.arange(n) < n * init_percent_sick
+        rng = env.rng.component('population')
+
+        def gaussians(avg, scale):
+            return env.rng.gaussians('population').draw_array(np.full(n, avg), np.full(n, scale))
+
+        habits = {
+            'really_sick': sick & (rng.random(n) >= 0.9),
+            'never_recovers': rng.random(n) >= 0.99,
+            'avg_shopping_time': gaussians(AVERAGE_SHOP_TIME_MINUTES, SCALE_SHOP_TIME_MINUTES),
+            'scale_shopping_time': gaussians(AVG_SCALE_SHOP_TIME_MINUTES, SCALE_SCALE_SHOP_TIME_MINUTES),
+            'avg_exercise_time': gaussians(AVG_EXERCISE_MINUTES, SCALE_EXERCISE_MINUTES),
+            'scale_exercise_time': gaussians(AVG_SCALE_EXERCISE_MINUTES, SCALE_SCALE_EXERCISE_MINUTES),
+            'avg_working_hours': gaussians(AVG_WORKING_HOURS, SCALE_WORKING_HOURS),
+            'scale_working_hours': gaussians(AVG_SCALE_WORKING_HOURS, SCALE_SCALE_WORKING_HOURS),
+            'avg_misc_time': gaussians(AVG_MISC_MINUTES, SCALE_MISC_MINUTES),
+            'scale_misc_time': gaussians(AVG_SCALE_MISC_MINUTES, SCALE_SCALE_MISC_MINUTES),
+            'shopping_days': rng.integers(0, 7, n),
+            'shopping_hours': rng.integers(7, 20, n),
+            'exercise_days': rng.integers(0, 7, n),
+            'exercise_hours': rng.integers(7, 20, n),
+            'work_start_hour': rng.integers(7, 12, n),
+        }
+        return cls(env, households, workplaces,
+                   household=rng.integers(0, len(households), n),
+                   workplace=rng.integers(0, len(workplaces), n),
+                   infection_time=np.where(sick, 0., np.nan),
+                   habits=habits)
+
+    @classmethod
+    def from_humans(cls, humans, households):
+        """ arrays of a list of humans, whose households are indexed in households """
+        workplaces = list(dict.fromkeys(h.workplace for h in humans))
+        workplace_index = {}
+        for i, workplace in enumerate(workplaces):
+            workplace.index = workplace_index[workplace] = i
+        population = cls(humans[0].env if humans else None, households, workplaces,
+                         household=np.array([h.household.index for h in humans], dtype=np.int64),
+                         workplace=np.array([workplace_index[h.workplace] for h in humans], dtype=np.int64),
+                         infection_time=[np.nan if h.infection_time is None else h.infection_time for h in humans],
+                         habits={habit: np.array([getattr(h, habit) for h in humans]) for habit in Human.habits},
+                         names=[h.name for h in humans],
+                         rho=[h.rho for h in humans],
+                         gamma=[h.gamma for h in humans])
+        for i, h in enumerate(humans):
+            population._humans[i] = h
+            population._visits[i] = h.visits
+        return population
+
+    def __len__(self):
+        return len(self.household)
+
+    def __getitem__(self, i):
+        human = self._humans.get(i)
+        if human is None:
+            infection_time = self.infection_time[i]
+            human = self._humans[i] = Human(
+                self.env,
+                name=self.names[i].item(),
+                infection_time=None if np.isnan(infection_time) else infection_time.item(),
+                household=self.households[self.household[i]],
+                workplace=self.workplaces[self.workplace[i]],
+                rho=self.rho[i].item(),
+                gamma=self.gamma[i].item(),
+                habits={habit: values[i].item() for habit, values in self.habits.items()},
+            )
+            human.visits = self.visits(i)
+        return human
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def visits(self, i):
+        """ visit history of the human i, created on first use """
+        visits = self._visits.get(i)
+        if visits is None:
+            visits = self._visits[i] = Visits()
+        return visits
+
+    def get_state(self):
+        """ arrays of the humans and of their visit histories, see from_state """
+        return {
+            'names': self.names,
+            'household': self.household,
+            'workplace': self.workplace,
+            'infection_time': self.infection_time,
+            'rho': np.ascontiguousarray(self.rho),
+            'gamma': np.ascontiguousarray(self.gamma),
+            'habits': self.habits,
+            'visits': self.get_visits_state(),
+        }
+
+    @classmethod
+    def from_state(cls, env, households, workplaces, state):
+        """ population of a state of get_state, on env, living in households and working in workplaces """
+        state = dict(state)
+        visits = state.pop('visits')
+        population = cls(env, households, workplaces, **state)
+        population.set_visits_state(visits)
+        return population
+
+    def get_visits_state(self):
+        """ visit histories as flat arrays: for every type of location, the humans with a counter, the number of
+        locations of each counter and the concatenated locations and Fenwick trees of the counters """
+        state = {}
+        for location_type in Visits.__slots__:
+            humans = [i for i, visits in self._visits.items() if getattr(visits, location_type)]
+            counters = [getattr(self._visits[i], location_type) for i in humans]
+            state[location_type] = {
+                'humans': np.array(humans, dtype=np.int64),
+                'lengths': np.array([len(counter) for counter in counters], dtype=np.int64),
+                'locations': np.array([l for counter in counters for l in counter.locations], dtype=np.int32),
+                'trees': np.array([c for counter in counters for c in counter.counts.tree[1:]], dtype=np.int32),
+                'totals': np.array([counter.counts.total for counter in counters], dtype=np.int64),
+            }
+        return state
+
+    def set_visits_state(self, state):
+        for location_type, arrays in state.items():
+            ends = np.cumsum(arrays['lengths']).tolist()
+            starts = [0] + ends[:-1]
+            for i, start, end, total in zip(arrays['humans'].tolist(), starts, ends, arrays['totals'].tolist()):
+                counter = self.visits(i).counter(location_type)
+                counter.locations = array('i', arrays['locations'][start:end].tolist())
+                counter.counts.tree = array('i', [0] + arrays['trees'][start:end].tolist())
+                counter.counts.total = total
 
 
 class Human(object):
@@ -197,60 +948,92 @@ class Human(object):
         'exercise': 4
     }
 
-    def __init__(self, env, name, infection_timestamp, household, workplace, rho=0.3, gamma=0.21):
+    # drawn for every human, Population draws them as arrays
+    habits = ('really_sick', 'never_recovers', 'avg_shopping_time', 'scale_shopping_time', 'avg_exercise_time',
+              'scale_exercise_time', 'avg_working_hours', 'scale_working_hours', 'avg_misc_time', 'scale_misc_time',
+              'shopping_days', 'shopping_hours', 'exercise_days', 'exercise_hours', 'work_start_hour')
+
+    def __init__(self, env, name, infection_time, household, workplace, rho=0.3, gamma=0.21, habits=None):
         self.env = env
-        self.events = []
         self.name = name
 
         self.household = household
         self.workplace = workplace
         self.location = household
+        # locations whose humans contain this human
+        self.present_at = []
         self.rho = rho
         self.gamma = gamma
 
         self.action = Human.actions['at_home']
         self.visits = Visits()
+        self._rng = None
+        self._gaussians = None
+
+        # tick of the infection, None while healthy
+        self.infection_time = infection_time
+        if habits is not None:
+            for habit in Human.habits:
+                setattr(self, habit, habits[habit])
+            return
 
+        rng, gaussians = self.rng, self.gaussians
         # Indicates whether this person will show severe signs of illness.
-        self.infection_timestamp = infection_timestamp
-        self.really_sick = self.is_sick and random.random() >= 0.9
-        self.never_recovers = random.random() >= 0.99
+        self.really_sick = self.is_sick and rng.random() >= 0.9
+        self.never_recovers = rng.random() >= 0.99
 
         # habits
-        self.avg_shopping_time = _draw_random_discreet_gaussian(AVERAGE_SHOP_TIME_MINUTES, SCALE_SHOP_TIME_MINUTES)
-        self.scale_shopping_time = _draw_random_discreet_gaussian(AVG_SCALE_SHOP_TIME_MINUTES,
-                                                                  SCALE_SCALE_SHOP_TIME_MINUTES)
+        self.avg_shopping_time = gaussians.draw(AVERAGE_SHOP_TIME_MINUTES, SCALE_SHOP_TIME_MINUTES)
+        self.scale_shopping_time = gaussians.draw(AVG_SCALE_SHOP_TIME_MINUTES, SCALE_SCALE_SHOP_TIME_MINUTES)
 
-        self.avg_exercise_time = _draw_random_discreet_gaussian(AVG_EXERCISE_MINUTES, SCALE_EXERCISE_MINUTES)
-        self.scale_exercise_time = _draw_random_discreet_gaussian(AVG_SCALE_EXERCISE_MINUTES,
-                                                                  SCALE_SCALE_EXERCISE_MINUTES)
+        self.avg_exercise_time = gaussians.draw(AVG_EXERCISE_MINUTES, SCALE_EXERCISE_MINUTES)
+        self.scale_exercise_time = gaussians.draw(AVG_SCALE_EXERCISE_MINUTES, SCALE_SCALE_EXERCISE_MINUTES)
 
-        self.avg_working_hours = _draw_random_discreet_gaussian(AVG_WORKING_HOURS, SCALE_WORKING_HOURS)
-        self.scale_working_hours = _draw_random_discreet_gaussian(AVG_SCALE_WORKING_HOURS, SCALE_SCALE_WORKING_HOURS)
+        self.avg_working_hours = gaussians.draw(AVG_WORKING_HOURS, SCALE_WORKING_HOURS)
+        self.scale_working_hours = gaussians.draw(AVG_SCALE_WORKING_HOURS, SCALE_SCALE_WORKING_HOURS)
 
-        self.avg_misc_time = _draw_random_discreet_gaussian(AVG_MISC_MINUTES, SCALE_MISC_MINUTES)
-        self.scale_misc_time = _draw_random_discreet_gaussian(AVG_SCALE_MISC_MINUTES, SCALE_SCALE_MISC_MINUTES)
+        self.avg_misc_time = gaussians.draw(AVG_MISC_MINUTES, SCALE_MISC_MINUTES)
+        self.scale_misc_time = gaussians.draw(AVG_SCALE_MISC_MINUTES, SCALE_SCALE_MISC_MINUTES)
 
         # TODO: multiple possible days and times & limit these activities in a week
-        self.shopping_days = np.random.choice(range(7))
-        self.shopping_hours = np.random.choice(range(7, 20))
+        self.shopping_days = rng.choice(range(7))
+        self.shopping_hours = rng.choice(range(7, 20))
 
-        self.exercise_days = np.random.choice(range(7))
-        self.exercise_hours = np.random.choice(range(7, 20))
+        self.exercise_days = rng.choice(range(7))
+        self.exercise_hours = rng.choice(range(7, 20))
 
-        self.work_start_hour = np.random.choice(range(7, 12))
+        self.work_start_hour = rng.choice(range(7, 12))
+
+    @property
+    def rng(self):
+        """ random stream of this human, the agent stream of its name in env.rng """
+        if self._rng is None:
+            self._rng = self.env.rng.agent(self.name)
+        return self._rng
+
+    @property
+    def gaussians(self):
+        """ TruncatedGaussianPool of the durations of this human, drawing from its stream """
+        if self._gaussians is None:
+            # small first blocks, a human only draws a few durations a day
+            self._gaussians = TruncatedGaussianPool(self.rng, block_size=8)
+        return self._gaussians
 
     def to_sick_to_shop(self):
         # Assume 2 weeks incubation time ; in 10% of cases person becomes to sick
         # to go shopping after 2 weeks for at least 10 days and in 1% of the cases
         # never goes shopping again.
-        time_since_sick_delta = self.env.timestamp - self.infection_timestamp
+        time_since_sick = self.env.now - self.infection_time
         in_peak_illness_time = (
-                time_since_sick_delta >= INCUBATION_DAYS * 24 * 60 and
-                time_since_sick_delta <= (INCUBATION_DAYS + NUM_DAYS_SICK) * 24 * 60
+                time_since_sick >= INCUBATION_DAYS * ticks_per_day() and
+                time_since_sick <= (INCUBATION_DAYS + NUM_DAYS_SICK) * ticks_per_day()
         )
         return (in_peak_illness_time or self.never_recovers) and self.really_sick
 
+    @property
+    def events(self):
+        return self.env.event_log.to_dicts(human_id=self.name)
+
     def lat(self):
         return self.location.lat if self.location else self.household.lat
 
@@ -263,7 +1046,19 @@ class Human(object):
 
     @property
     def is_sick(self):
-        return self.infection_timestamp is not None  # TODO add recovery
+        return self.infection_time is not None  # TODO add recovery
+
+    @property
+    def infection_timestamp(self):
+        if self.infection_time is None:
+            return None
+        return self.env.initial_timestamp + datetime.timedelta(minutes=self.infection_time * TICK_MINUTE)
+
+    def infect(self, time):
+        if not self.is_sick:
+            for location in self.present_at:
+                location.n_sick += 1
+        self.infection_time = time
 
     def __repr__(self):
         return f"person:{self.name}, sick:{self.is_sick}"
@@ -273,30 +1068,34 @@ class Human(object):
            1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 21 22 23 24
            State  h h h h h h h h h sh sh h  h  h  ac h  h  h  h  h  h  h  h  h
         """
-        self.household.humans.add(self)
+        self.household.add_human(self)
+        yield from self.live(city)
+
+    def live(self, city):
+        """ the daily routine of run: every hour, at most one activity followed by an hour at home """
         while True:
             # Simulate some tests
-            if self.is_sick and self.env.timestamp - self.infection_timestamp > datetime.timedelta(
-                    days=INCUBATION_DAYS):
+            hour_of_day, day_of_week = self.env.hour_of_day(), self.env.day_of_week()
+            if self.is_sick and self.env.now - self.infection_time > INCUBATION_DAYS * ticks_per_day():
                 # Todo ensure it only happen once
-                result = random.random() > 0.8
-                Event.log_test(self, time=self.env.timestamp, result=result)
+                result = self.rng.random() > 0.8
+                Event.log_test(self, time=self.env.now, result=result)
                 # Fixme: After a user get tested positive, assume no more activity
                 break
 
-            elif self.env.hour_of_day() == self.work_start_hour and not self.env.is_weekend() and not WORK_FROM_HOME:
+            elif hour_of_day == self.work_start_hour and day_of_week not in (0, 6) and not WORK_FROM_HOME:
                 yield self.env.process(self.go_to_work())
 
-            elif self.env.hour_of_day() == self.shopping_hours and self.env.day_of_week() == self.shopping_days:
+            elif hour_of_day == self.shopping_hours and day_of_week == self.shopping_days:
                 yield self.env.process(self.shop(city))
-            elif self.env.hour_of_day() == self.exercise_hours and self.env.day_of_week() == self.exercise_days:  ##LIMIT AND VARIABLE
+            elif hour_of_day == self.exercise_hours and day_of_week == self.exercise_days:  ##LIMIT AND VARIABLE
                 yield self.env.process(self.exercise(city))
-            elif np.random.random() < 0.05 and self.env.is_weekend():
+            elif self.rng.random() < 0.05 and day_of_week in (0, 6):
                 yield self.env.process(self.take_a_trip(city))
-            elif self.is_sick and self.env.timestamp - self.infection_timestamp > datetime.timedelta(days=SYMPTOM_DAYS):
+            elif self.is_sick and self.env.now - self.infection_time > SYMPTOM_DAYS * ticks_per_day():
                 # Stay home after symptoms
                 # TODO: ensure it only happen once
-                # Event.log_symptom_start(self, time=env.timestamp)
+                # Event.log_symptom_start(self, time=env.now)
                 pass
             self.location = self.household
             yield self.env.process(self.stay_at_home())
@@ -306,23 +1105,26 @@ class Human(object):
         yield self.env.process(self.at(self.household, 60))
 
     def go_to_work(self):
-        t = _draw_random_discreet_gaussian(self.avg_working_hours, self.scale_working_hours)
+        t = self.gaussians.draw(self.avg_working_hours, self.scale_working_hours)
         yield self.env.process(self.at(self.workplace, t))
 
-    def take_a_trip(self, city):
-        S = 0
-        p_exp = 1.0
+    def take_a_trip(self, city, stops=0):
+        # number of miscs visited during the trip, kept on the human so that a checkpoint can save it
+        self.trip_stops = stops
         while True:
-            if np.random.random() > p_exp:  # return home
+            if self.trip_stops == 0:
+                p_exp = 1.0
+            else:
+                p_exp = self.rho * self.trip_stops ** (-self.gamma * self.adjust_gamma)
+            if self.rng.random() > p_exp:  # return home
                 yield self.env.process(self.at(self.household, 60))
                 break
 
             loc = self._select_location(location_type='miscs', city=city)
-            S += 1
-            p_exp = self.rho * S ** (-self.gamma * self.adjust_gamma)
+            self.trip_stops += 1
             with loc.request() as request:
                 yield request
-                t = _draw_random_discreet_gaussian(self.avg_misc_time, self.scale_misc_time)
+                t = self.gaussians.draw(self.avg_misc_time, self.scale_misc_time)
                 yield self.env.process(self.at(loc, t))
 
     def shop(self, city):
@@ -331,13 +1133,13 @@ class Human(object):
 
         with grocery_store.request() as request:
             yield request
-            t = _draw_random_discreet_gaussian(self.avg_shopping_time, self.scale_shopping_time)
+            t = self.gaussians.draw(self.avg_shopping_time, self.scale_shopping_time)
             yield self.env.process(self.at(grocery_store, t))
 
     def exercise(self, city):
         self.action = Human.actions['exercise']
         park = self._select_location(location_type="park", city=city)
-        t = _draw_random_discreet_gaussian(self.avg_shopping_time, self.scale_shopping_time)
+        t = self.gaussians.draw(self.avg_shopping_time, self.scale_shopping_time)
         yield self.env.process(self.at(park, t))
 
     def _select_location(self, location_type, city):
@@ -349,68 +1151,156 @@ class Human(object):
         if location_type == "park":
             S = self.visits.n_parks
             self.adjust_gamma = 1.0
-            pool_pref = self.parks_preferences
+            pool_pref = city.parks_preferences[self.household.index]
+            sampler = city.preference_sampler('parks', self.household)
             locs = city.parks
-            visited_locs = self.visits.parks
+            visited_locs = self.visits.counter('parks')
 
         elif location_type == "stores":
             S = self.visits.n_stores
             self.adjust_gamma = 1.0
-            pool_pref = self.stores_preferences
+            pool_pref = city.stores_preferences[self.household.index]
+            sampler = city.preference_sampler('stores', self.household)
             locs = city.stores
-            visited_locs = self.visits.stores
+            visited_locs = self.visits.counter('stores')
 
         elif location_type == "miscs":
             S = self.visits.n_miscs
             self.adjust_gamma = 1.0
-            pool_pref = [(city.compute_distance(self.location, m) + 1e-1) ** -1 for m in city.miscs if
-                         m != self.location]
-            pool_locs = [m for m in city.miscs if m != self.location]
+            pool_pref = city.miscs_preferences(self.location)
+            sampler = city.preference_sampler('miscs', self.location)
             locs = city.miscs
-            visited_locs = self.visits.miscs
+            visited_locs = self.visits.counter('miscs')
 
         else:
             raise ValueError(f'Unknown location_type:{location_type}')
 
+        return locs[self._choose_location(S, self.rho, self.gamma * self.adjust_gamma, pool_pref, sampler,
+                                          visited_locs, self.rng)]
+
+    @staticmethod
+    def _choose_location(S, rho, gamma, pool_pref, sampler, visited_locs, rng):
+        """
+        Explores a new location with probability rho * S ** -gamma, S being the number of locations visited so far,
+        or returns to a visited one in proportion to its visits. Returns the index of the location and counts the visit.
+        """
         if S == 0:
             p_exp = 1.0
         else:
-            p_exp = self.rho * S ** (-self.gamma * self.adjust_gamma)
+            p_exp = rho * S ** (-gamma)
 
-        if np.random.random() < p_exp and S != len(locs):
-            # explore
-            cands = [i for i in locs if i not in visited_locs]
-            cands = [(loc, pool_pref[i]) for i, loc in enumerate(cands)]
-        else:
+        index = None
+        if rng.random() < p_exp and S != len(pool_pref):
+            index = Human._explore(pool_pref, sampler, visited_locs, rng)
+        if index is None:
             # exploit
-            cands = [(i, count) for i, count in visited_locs.items()]
+            index = visited_locs.sample(rng.random())
 
-        cands, scores = zip(*cands)
-        loc = np.random.choice(cands, p=_normalize_scores(scores))
-        visited_locs[loc] += 1
-        return loc
+        visited_locs.visit(index)
+        return index
+
+    @staticmethod
+    def _explore(pool_pref, sampler, visited_locs, rng, max_draws=16):
+        """
+        Draws an unvisited location in proportion to its preference, by drawing from all the locations with the
+        alias table until an unvisited one comes up. When most of the preference lies on visited locations, falls
+        back on a scan of the unvisited ones. Returns None if there is no location left to explore.
+        """
+        if sampler.total > 0:
+            for _ in range(max_draws):
+                i = sampler.sample(rng.random())
+                if i not in visited_locs and pool_pref[i] > 0:
+                    return i
+
+        cands = [i for i in range(len(pool_pref)) if i not in visited_locs and pool_pref[i] > 0]
+        if not cands:
+            return None
+        return cands[rng.choice(len(cands), p=_normalize_scores(pool_pref[cands]))]
 
     def at(self, location, duration):
         self.location = location
-        location.humans.add(self)
-        self.leaving_time = duration + self.env.now
+        location.add_human(self)
+        self.leaving_time = self.env.now + duration / TICK_MINUTE
         self.start_time = self.env.now
 
         # Report all the encounters
-        for h in location.humans:
-            if h == self or location.location_type == 'household':
-                continue
-            Event.log_encounter(self, h,
-                                location=location,
-                                duration=min(self.leaving_time, h.leaving_time) - max(self.start_time, h.start_time),
-                                distance=np.random.randint(50, 1000),
-                                # cm  #TODO: prop to Area and inv. prop to capacity
-                                time=self.env.timestamp,
-                                )
+        if location.location_type != 'household':
+            self.encounter(location)
 
         if not self.is_sick:
-            if random.random() < location.contamination_proba():
-                self.infection_timestamp = self.env.timestamp
-                Event.log_contaminate(self, self.env.timestamp)
+            if self.rng.random() < location.contamination_proba():
+                self.infect(self.env.now)
+                Event.log_contaminate(self, self.env.now)
         yield self.env.timeout(duration / TICK_MINUTE)
-        location.humans.remove(self)
+        location.remove_human(self)
+
+    def resume(self, city, activity, stay=None, request=None):
+        """
+        continues run from the middle of activity (the name of its generator), for a simulation restored from a
+        checkpoint, see ProcessSimulation.restore. stay is the (location, timeout) of the stay the human is in, request
+        its Request of a store or misc, which is still waited for when there is no stay.
+        """
+        resumed = self._resume_activity(city, activity, stay, request)
+        # named after the activity it continues, which is what a checkpoint of the process looks at
+        resumed.__name__ = activity
+        yield self.env.process(resumed)
+        if activity != 'stay_at_home':
+            self.location = self.household
+            yield self.env.process(self.stay_at_home())
+        yield from self.live(city)
+
+    def _resume_activity(self, city, activity, stay, request):
+        if request is None:
+            # at home, at work, in a park or on the way home from a trip
+            yield self.env.process(self._resume_stay(*stay))
+            return
+
+        with request:
+            if stay is None:
+                yield request
+                if activity == 'shop':
+                    t = self.gaussians.draw(self.avg_shopping_time, self.scale_shopping_time)
+                else:
+                    t = self.gaussians.draw(self.avg_misc_time, self.scale_misc_time)
+                yield self.env.process(self.at(request.resource, t))
+            else:
+                yield self.env.process(self._resume_stay(*stay))
+        if activity == 'take_a_trip':
+            yield from self.take_a_trip(city, self.trip_stops)
+
+    def _resume_stay(self, location, timeout):
+        # the end of at
+        yield timeout
+        location.remove_human(self)
+
+    def encounter(self, location):
+        """ logs the encounters of the human arriving at location with its other occupants """
+        mode = self.env.encounter_mode
+        if mode == 'pairs':
+            for h in location.humans:
+                if h == self:
+                    continue
+                Event.log_encounter(self, h,
+                                    location=location,
+                                    duration=TICK_MINUTE * (min(self.leaving_time, h.leaving_time) -
+                                                            max(self.start_time, h.start_time)),
+                                    distance=self.rng.integers(50, 1000),
+                                    # cm  #TODO: prop to Area and inv. prop to capacity
+                                    time=self.env.now,
+                                    )
+            return
+
+        others = [h for h in location.humans if h is not self]
+        if not others:
+            return
+        leaving_times = np.fromiter((h.leaving_time for h in others), dtype=np.float64, count=len(others))
+        start_times = np.fromiter((h.start_time for h in others), dtype=np.float64, count=len(others))
+        # overlaps of the stays, in minutes
+        durations = TICK_MINUTE * (np.minimum(self.leaving_time, leaving_times) -
+                                   np.maximum(self.start_time, start_times))
+        if mode == 'batched':
+            self.env.event_log.log_encounters(self, others, location, durations,
+                                              distances=self.rng.integers(50, 1000, size=len(others)),
+                                              time=self.env.now)
+        else:
+            self.env.event_log.log_contacts(location, len(others), float(durations.sum()), time=self.env.now)
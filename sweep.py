@@ -0,0 +1,110 @@
+import ast
+import contextlib
+import inspect
+import itertools
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from run import simulate
+from simulator import Event, ticks_per_day
+
+# arguments of simulate for the parameters a sweep does not set, the defaults of run.py sim
+DEFAULTS = dict(n_people=1000, n_stores=100, n_parks=20, n_misc=100, init_percent_sick=0.01, simulation_days=30)
+SIMULATE_PARAMETERS = set(inspect.signature(simulate).parameters) - {'outfile', 'print_progress', 'stream_events',
+                                                                     'checkpoint_days', 'seed', 'profile'}
+CONFIG_PARAMETERS = {name for name in vars(config) if name.isupper()}
+
+
+@contextlib.contextmanager
+def config_overrides(**params):
+    """ sets config.py parameters in config and in every loaded module which imported them with
+    from config import ..., and restores them on exit """
+    unknown = set(params) - CONFIG_PARAMETERS
+    if unknown:
+        raise ValueError(f'Unknown config parameters:{sorted(unknown)}')
+    # the globals of a module which imported a parameter are the object of config
+    modules = [module for module in list(sys.modules.values()) if module is not None]
+    saved = [(module, name, getattr(config, name)) for module in modules for name in params
+             if vars(module).get(name, config) is getattr(config, name)]
+    try:
+        for module, name, _ in saved:
+            setattr(module, name, params[name])
+        yield
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+
+def parse_grid(params):
+    """ grid of values from NAME=v1,v2,... strings, values are python literals or plain strings """
+    grid = {}
+    for param in params:
+        name, _, values = param.partition('=')
+        name = name.strip()
+        if name not in SIMULATE_PARAMETERS and name not in CONFIG_PARAMETERS:
+            raise ValueError(f'Unknown parameter:{name}')
+        grid[name] = [_parse_value(value) for value in values.split(',')]
+    return grid
+
+
+def _parse_value(value):
+    try:
+        return ast.literal_eval(value.strip())
+    except (ValueError, SyntaxError):
+        return value.strip()
+
+
+def summarize(env, n_people, init_percent_sick, simulation_days):
+    """ summary statistics of the events of a simulation """
+    log = env.event_log
+    log.close_contacts()
+    contaminations = log.tables[Event.contamination].to_array()
+    tests = log.tables[Event.test].to_array()
+    daily = np.bincount((contaminations['time'] // ticks_per_day()).astype(int), minlength=simulation_days)
+    initially_sick = min(n_people, math.ceil(n_people * init_percent_sick))
+    return {
+        'initially_sick': initially_sick,
+        'contaminations': len(contaminations),
+        'attack_rate': (initially_sick + len(contaminations)) / n_people,
+        'peak_day': int(daily.argmax()),
+        'peak_contaminations': int(daily.max()),
+        'tests': len(tests),
+        'positive_tests': int(tests['result'].sum()),
+        'encounters': len(log.tables[Event.encounter]) + int(log.tables[Event.contacts].to_array()['contacts'].sum()),
+    }
+
+
+def run_replicate(params, seed):
+    """ runs one simulation with the parameters, config.py ones included, and returns its row of results """
+    simulate_params = dict(DEFAULTS)
+    config_params = {}
+    for name, value in params.items():
+        if name in CONFIG_PARAMETERS:
+            config_params[name] = value
+        else:
+            simulate_params[name] = value
+
+    with config_overrides(**config_params):
+        start_time = time.time()
+        env, _ = simulate(seed=seed, **simulate_params)
+        row = dict(params, seed=seed)
+        row.update(summarize(env, simulate_params['n_people'], simulate_params['init_percent_sick'],
+                             simulate_params['simulation_days']))
+        row['seconds'] = time.time() - start_time
+    return row
+
+
+def run_sweep(grid, seeds, workers=None):
+    """ runs every combination of the values of grid with every seed over a process pool, returns their rows in
+    the order of the combinations and seeds """
+    names = list(grid)
+    jobs = [(dict(zip(names, values)), seed) for values in itertools.product(*grid.values()) for seed in seeds]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_replicate, params, seed) for params, seed in jobs]
+        return [future.result() for future in futures]
+
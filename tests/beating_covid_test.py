@@ -0,0 +1,132 @@
+import unittest
+
+from Beating_Covid import CompactGraph, Graph
+from tournament import random_contact_graph
+
+
+def scan_frontier(graph):
+    """The nodes at risk in the order of the original scan over the neutral
+    neighbours of the infected nodes, in infection order."""
+
+    nodes = []
+    for infected_node_id in graph.infected_node_ids:
+        for neighbor_id in graph.get_neutral_neighbor_ids_of_a_node(infected_node_id):
+            if neighbor_id not in nodes:
+                nodes.append(neighbor_id)
+    return nodes
+
+
+class TieBreakingTest(unittest.TestCase):
+
+    def test_equal_moves_in_scan_order(self):
+        # every move saves 10, the first neighbour scanned wins whatever the
+        # order the connections were added in
+        graph = Graph([1, 2, 3, 4], [10, 10, 10, 10], first_infected_node_id=1)
+        graph.add_connections([(1, 4), (1, 2), (1, 3)])
+        self.assertEqual(list(graph.get_nodes_that_will_be_infected_in_next_step()), [2, 3, 4])
+        self.assertEqual(graph.node_to_vaccinate_alternate(), (2, 10))
+        self.assertEqual(graph.node_to_vaccinate_alternate_alpha(), (2, 10))
+
+    def test_frontier_in_scan_order_during_games(self):
+        for seed in range(20):
+            graph = random_contact_graph(30, 0.1, seed=seed)
+            while len(graph.get_nodes_that_will_be_infected_in_next_step()):
+                self.assertEqual(list(graph.get_nodes_that_will_be_infected_in_next_step()), scan_frontier(graph))
+                node_id, value = graph.node_to_vaccinate_alternate_alpha()
+                self.assertEqual(list(graph.get_nodes_that_will_be_infected_in_next_step()), scan_frontier(graph))
+                graph.play_one_step(node_id)
+
+
+class SearchTest(unittest.TestCase):
+    """The pruned, anytime and parallel searches find the value of the
+    exhaustive one."""
+
+    def test_same_values_as_exhaustive_search(self):
+        for seed in range(10):
+            graph = random_contact_graph(16, 0.2, seed=seed)
+            value = graph.node_to_vaccinate_alternate()[1]
+            self.assertEqual(graph.node_to_vaccinate_alternate_alpha()[1], value)
+            self.assertEqual(graph.node_to_vaccinate_anytime()[1], value)
+
+    def test_parallel_search(self):
+        for seed, split_depth in ((0, 1), (1, 2)):
+            graph = random_contact_graph(16, 0.2, seed=seed)
+            value = graph.node_to_vaccinate_alternate()[1]
+            self.assertEqual(graph.node_to_vaccinate_parallel(workers=2, split_depth=split_depth)[1], value)
+
+    def test_anytime_search_within_budget(self):
+        graph = random_contact_graph(16, 0.2, seed=4)
+        node_id, value = graph.node_to_vaccinate_anytime(node_budget=50)
+        self.assertIn(node_id, graph.get_nodes_that_will_be_infected_in_next_step())
+        # the budget stops the search at its first expansion past 50 positions
+        self.assertLessEqual(graph.search_stats.nodes_expanded, 51)
+        self.assertGreaterEqual(graph.search_stats.depth_reached, 1)
+
+
+class CompactGraphTest(unittest.TestCase):
+
+    def test_same_values_as_graph(self):
+        for seed in range(10):
+            graph, compact = (random_contact_graph(20, 0.15, seed=seed, graph_class=cls) for cls in (Graph, CompactGraph))
+            while len(graph.get_nodes_that_will_be_infected_in_next_step()):
+                self.assertEqual(set(compact.get_nodes_that_will_be_infected_in_next_step()),
+                                 set(graph.get_nodes_that_will_be_infected_in_next_step()))
+                self.assertEqual(list(compact.get_frontier_in_scan_order()), scan_frontier(compact))
+                node_id, value = graph.node_to_vaccinate_alternate()
+                self.assertEqual(compact.node_to_vaccinate_alternate()[1], value)
+                self.assertEqual(compact.node_to_vaccinate_alternate_alpha()[1], value)
+                graph.play_one_step(node_id)
+                compact.play_one_step(node_id)
+                self.assertEqual(compact.get_sum_of_weights_of_all_healthy_nodes(),
+                                 graph.get_sum_of_weights_of_all_healthy_nodes())
+                self.assertEqual(compact.get_sum_of_weights_of_all_infected_nodes(),
+                                 graph.get_sum_of_weights_of_all_infected_nodes())
+
+    def test_nodes(self):
+        compact = CompactGraph([1, 2, 3], [10, 20, 30], first_infected_node_id=1)
+        compact.add_connections([(1, 3), (1, 2)])
+        nodes = compact.get_nodes_that_will_be_infected_in_next_step()
+        self.assertEqual(list(nodes), [2, 3])
+        self.assertEqual([(node.id, node.get_weight()) for node in nodes.values()], [(2, 20), (3, 30)])
+        self.assertIs(nodes[2], compact.graph[2])
+        self.assertTrue(compact.graph[1].is_infected())
+        self.assertEqual(compact.graph[1].get_neighbor_node_ids(), {2, 3})
+        compact.vaccinate_node(3)
+        self.assertTrue(compact.graph[3].is_vaccinated())
+        self.assertFalse(compact.graph[3].is_infected())
+
+    def test_infect_and_cure(self):
+        compact = CompactGraph([1, 2, 3], [10, 20, 30], first_infected_node_id=1)
+        compact.add_connections([(1, 2), (2, 3)])
+        compact.infect_node(2)
+        self.assertEqual(list(compact.get_nodes_that_will_be_infected_in_next_step()), [3])
+        self.assertEqual(compact.get_sum_of_weights_of_all_healthy_nodes(), 30)
+        compact.cure_node(2)
+        self.assertEqual(list(compact.get_nodes_that_will_be_infected_in_next_step()), [2])
+        self.assertEqual(compact.get_sum_of_weights_of_all_healthy_nodes(), 50)
+
+    def test_update_frontier(self):
+        compact = CompactGraph([1, 2, 3], [10, 20, 30], first_infected_node_id=1)
+        compact.add_connections([(1, 2), (2, 3)])
+        self.assertEqual(list(compact.get_frontier_in_scan_order()), [2])
+        held = compact.get_at_risk_mask()
+        # state changed in the arrays, then the node is updated like in Graph
+        compact.infected[compact.node_index[2]] = True
+        compact.infected_node_ids.append(2)
+        compact.update_frontier(2)
+        compact.update_frontier(3)
+        self.assertEqual(list(compact.get_frontier_in_scan_order()), [3])
+        self.assertEqual(list(compact.get_nodes_that_will_be_infected_in_next_step()), [3])
+        # the mask held by an undo record is left alone
+        self.assertEqual(held.tolist(), [False, True, False])
+
+    def test_frontier_in_scan_order(self):
+        graph = Graph([1, 2, 3, 4], [10, 10, 10, 10], first_infected_node_id=1)
+        compact = CompactGraph([1, 2, 3, 4], [10, 10, 10, 10], first_infected_node_id=1)
+        for g in (graph, compact):
+            g.add_connections([(1, 4), (1, 2), (1, 3)])
+        self.assertEqual(list(compact.get_frontier_in_scan_order()), list(graph.get_frontier_in_scan_order()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from monitors import EventMonitor
+
+
+class EventMonitorTest(unittest.TestCase):
+
+    def test_dump_before_run(self):
+        monitor = EventMonitor(f=120)
+        with tempfile.TemporaryDirectory() as directory:
+            dest = os.path.join(directory, 'out')
+            monitor.dump(dest)
+            with open(f'{dest}.pkl', 'rb') as f:
+                self.assertEqual(pickle.load(f), [])
+        self.assertEqual(monitor.data, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
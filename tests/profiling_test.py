@@ -0,0 +1,48 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from profiling import HOT_PATHS, Profiler
+from run import run_simu
+from simulator import Env, Human
+
+CITY = dict(n_stores=5, n_people=100, n_parks=2, n_misc=5, init_percent_sick=0.1)
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_install_uninstall(self):
+        env = Env(datetime.datetime(2020, 2, 28))
+        originals = [vars(owner)[name] for owner, name in HOT_PATHS]
+        profiler = Profiler()
+        profiler.install(env)
+        self.assertIsNot(vars(Human)['encounter'], originals[HOT_PATHS.index((Human, 'encounter'))])
+        self.assertIn('step', vars(env))
+        env.timeout(1)
+        env.run(until=2)
+        # the timeout and the event which stops run
+        self.assertEqual(profiler.calls['Env.step'], 2)
+        profiler.uninstall()
+        self.assertEqual([vars(owner)[name] for owner, name in HOT_PATHS], originals)
+        self.assertNotIn('step', vars(env))
+
+    def test_profiled_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            outfile = os.path.join(directory, 'out')
+            events = run_simu(simulation_days=1, outfile=outfile, seed=1, **CITY)
+            profiled = run_simu(simulation_days=1, outfile=outfile, seed=1, profile=True, **CITY)
+            with open(f'{outfile}.profile.json') as f:
+                report = json.load(f)
+        self.assertEqual(profiled, events)
+        self.assertEqual(report['agents'], 100)
+        self.assertEqual(report['simulated_hours'], 24)
+        self.assertEqual(report['events'], len(events))
+        self.assertGreater(report['functions']['Human.encounter']['calls'], 0)
+        self.assertEqual(report['functions']['Env.step']['calls'], report['simpy_events'])
+        self.assertEqual(report['samples'][0]['time'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from run import resume_simu, run_simu
+
+CITY = dict(n_stores=5, n_people=100, n_parks=2, n_misc=5, init_percent_sick=0.1)
+
+
+class ReproducibilityTest(unittest.TestCase):
+
+    def test_same_seed_same_events(self):
+        for engine in ('simpy', 'vectorized'):
+            for encounter_mode in ('pairs', 'aggregate'):
+                with tempfile.TemporaryDirectory() as directory:
+                    outfile = os.path.join(directory, 'out')
+                    runs = [run_simu(simulation_days=2, outfile=outfile, engine=engine, encounter_mode=encounter_mode,
+                                     seed=seed, **CITY) for seed in (1, 1, 2)]
+                self.assertTrue(runs[0])
+                self.assertEqual(runs[0], runs[1])
+                self.assertNotEqual(runs[0], runs[2])
+
+    def test_batched_same_as_pairs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            outfile = os.path.join(directory, 'out')
+            runs = [run_simu(simulation_days=2, outfile=outfile, encounter_mode=encounter_mode, seed=1, **CITY)
+                    for encounter_mode in ('pairs', 'batched')]
+        self.assertEqual(runs[0], runs[1])
+
+
+class CheckpointTest(unittest.TestCase):
+    """A run resumed from its last checkpoint gives the events of an uninterrupted run."""
+
+    def check_resume(self, engine, stream_events, checkpoint_days, city=CITY, store_capacity=30):
+        with tempfile.TemporaryDirectory() as directory:
+            full, interrupted = os.path.join(directory, 'full'), os.path.join(directory, 'interrupted')
+            kwargs = dict(engine=engine, stream_events=stream_events, store_capacity=store_capacity,
+                          misc_capacity=store_capacity, seed=3, **city)
+            expected = list(run_simu(simulation_days=3, outfile=full, **kwargs))
+            # stops after the checkpoints of day 1 and 2, then extended to day 3
+            run_simu(simulation_days=2, outfile=interrupted, checkpoint_days=checkpoint_days, **kwargs)
+            resumed = list(resume_simu(interrupted, simulation_days=3))
+            self.assertEqual(resumed, expected)
+            if stream_events:
+                with open(f'{full}.events', 'rb') as f, open(f'{interrupted}.events', 'rb') as g:
+                    self.assertEqual(f.read(), g.read())
+
+    def test_vectorized(self):
+        for stream_events in (False, True):
+            self.check_resume('vectorized', stream_events, checkpoint_days=1)
+
+    def test_simpy(self):
+        for stream_events in (False, True):
+            self.check_resume('simpy', stream_events, checkpoint_days=1)
+
+    def test_simpy_mid_day(self):
+        # every 7 hours: at the last checkpoint, at 18:00, humans queue for the single place of a store or misc
+        city = dict(CITY, n_people=300, n_stores=2, n_misc=2)
+        self.check_resume('simpy', False, checkpoint_days=0.3, city=city, store_capacity=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
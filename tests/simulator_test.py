@@ -0,0 +1,290 @@
+import datetime
+import json
+import os
+import tempfile
+import types
+import unittest
+
+import numpy as np
+
+from config import CONTACT_BUCKET_MINUTES, TICK_MINUTE
+from processes import ProcessSimulation
+from simulator import City, Env, EventLog, EventReader, EventSink, Human, Location, Visits, ticks_to_timestamps
+
+START_TIME = datetime.datetime(2020, 2, 28, 0, 0)
+
+
+def sort_events(events):
+    return sorted(events, key=lambda event: json.dumps(event, sort_keys=True, default=str))
+
+
+class EventLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = Env(datetime.datetime(2020, 2, 28, 0, 0))
+        self.store = Location(self.env, location_type='store', lat=10, lon=20)
+        self.park = Location(self.env, location_type='park', lat=30, lon=40)
+        self.humans = [types.SimpleNamespace(name=i) for i in range(3)]
+
+    def log_events(self, event_log):
+        h0, h1, h2 = self.humans
+        hour = 60 / TICK_MINUTE
+        event_log.log_encounter(h0, h2, self.store, 7, 300, time=hour)
+        event_log.log_test(h1, True, time=hour)
+        event_log.log_contaminate(h2, time=hour)
+        event_log.log_encounters(h1, [h0, h2], self.park, [5, 6], [100, 200], time=2 * hour)
+        event_log.log_symptom_start(h0, time=3 * hour)
+
+    def test_to_dicts(self):
+        event_log = EventLog(self.env)
+        self.log_events(event_log)
+        one, two, three = (datetime.datetime(2020, 2, 28, hour, 0) for hour in (1, 2, 3))
+
+        def encounter(human_id, other, time, duration, distance, location):
+            return {'human_id': human_id, 'time': time, 'event_type': 'encounter',
+                    'payload': {'encounter_human_id': other, 'duration': duration, 'distance': distance,
+                                'lat': location.lat, 'lon': location.lon}}
+
+        self.assertEqual(event_log.to_dicts(), [
+            encounter(0, 2, one, 7, 300, self.store),
+            encounter(0, 1, two, 5, 100, self.park),
+            {'human_id': 0, 'time': three, 'event_type': 'symptom_start', 'payload': {'covid': True}},
+            {'human_id': 1, 'time': one, 'event_type': 'test', 'payload': {'result': True}},
+            encounter(1, 0, two, 5, 100, self.park),
+            encounter(1, 2, two, 6, 200, self.park),
+            encounter(2, 0, one, 7, 300, self.store),
+            {'human_id': 2, 'time': one, 'event_type': 'contamination', 'payload': {}},
+            encounter(2, 1, two, 6, 200, self.park),
+        ])
+        self.assertEqual(len(event_log), 9)
+        self.assertEqual(event_log.to_dicts(human_id=1), [e for e in event_log.to_dicts() if e['human_id'] == 1])
+
+    def test_contacts(self):
+        event_log = EventLog(self.env)
+        bucket = CONTACT_BUCKET_MINUTES / TICK_MINUTE
+        event_log.log_contacts(self.store, 3, 1.5, time=0)
+        event_log.log_contacts(self.store, 2, 0.5, time=bucket / 2)
+        event_log.log_contacts(self.park, 1, 0.25, time=bucket)
+        contacts = [(e['time'], e['payload']) for e in event_log.to_dicts()]
+        self.assertEqual(contacts, [
+            (datetime.datetime(2020, 2, 28), {'contacts': 5, 'exposure': 2.0, 'lat': 10, 'lon': 20}),
+            (datetime.datetime(2020, 2, 28) + datetime.timedelta(minutes=CONTACT_BUCKET_MINUTES),
+             {'contacts': 1, 'exposure': 0.25, 'lat': 30, 'lon': 40}),
+        ])
+
+    def test_streamed_events_read_back(self):
+        expected = EventLog(self.env)
+        self.log_events(expected)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.events')
+            event_log = EventLog(self.env)
+            sink = EventSink(path, batch_size=2)
+            event_log.stream_to(sink)
+            self.log_events(event_log)
+            # the tables of two rows were written out as they filled up
+            self.assertLess(sum(len(table) for table in event_log.tables.values()), 5)
+            event_log.flush()
+            sink.close()
+            self.assertEqual(event_log.to_dicts(), [])
+            self.assertEqual(len(event_log), len(expected))
+            self.assertEqual(sort_events(EventReader(path)), sort_events(expected.to_dicts()))
+
+
+class EventSinkTest(unittest.TestCase):
+
+    frames = [{'initial_timestamp': datetime.datetime(2020, 2, 28)}, ('locations', [(1, 2)]), ('test', [1, 2, 3])]
+
+    def write(self, path, frames, offset=0):
+        sink = EventSink(path, offset=offset)
+        for frame in frames:
+            sink.write(frame)
+        size = sink.file.tell()
+        sink.close()
+        return size
+
+    def test_frames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.events')
+            self.write(path, self.frames)
+            self.assertEqual(list(EventReader(path).frames()), self.frames)
+
+    def test_truncated_frame_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.events')
+            size = self.write(path, self.frames)
+            for cut in (1, 5, 12):
+                with open(path, 'r+b') as f:
+                    f.truncate(size - cut)
+                self.assertEqual(list(EventReader(path).frames()), self.frames[:2])
+                size = self.write(path, self.frames)
+
+    def test_resume_at_offset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.events')
+            offset = self.write(path, self.frames[:2])
+            # what a run wrote after its checkpoint is dropped by the run which resumes there
+            with open(path, 'ab') as f:
+                f.write(b'partial frame')
+            self.write(path, [('contamination', [7])], offset=offset)
+            self.assertEqual(list(EventReader(path).frames()), self.frames[:2] + [('contamination', [7])])
+
+
+
+class CalendarTest(unittest.TestCase):
+
+    def test_calendar_of_ticks(self):
+        for start in (START_TIME, datetime.datetime(2020, 3, 1, 13, 37)):
+            env = Env(start)
+            for tick in range(0, 30000, 7):
+                if tick:
+                    env.run(until=tick)
+                timestamp = start + datetime.timedelta(minutes=tick * TICK_MINUTE)
+                self.assertEqual(env.timestamp, timestamp)
+                self.assertEqual((env.minutes(), env.hour_of_day(), env.day_of_week()),
+                                 (timestamp.minute, timestamp.hour, timestamp.weekday()))
+            ticks = np.arange(0, 30000, 7)
+            self.assertEqual(ticks_to_timestamps(start, ticks),
+                             [start + datetime.timedelta(minutes=int(t) * TICK_MINUTE) for t in ticks])
+
+
+class VisitsTest(unittest.TestCase):
+
+    def test_humans_have_their_own_visits(self):
+        env = Env(START_TIME, seed=0)
+        home = Location(env, location_type='household', lat=0, lon=0)
+        h1, h2 = (Human(env, name=i, infection_time=None, household=home, workplace=home) for i in range(2))
+        self.assertIsNot(h1.visits, h2.visits)
+        h1.visits.counter('stores').visit(3)
+        h1.visits.counter('stores').visit(3)
+        self.assertEqual(h1.visits.n_stores, 1)
+        self.assertEqual(h2.visits.n_stores, 0)
+        self.assertIsNone(h2.visits.stores)
+        self.assertIsNone(Visits().stores)
+
+    def test_no_shared_visits_in_a_simulation(self):
+        env = Env(START_TIME, seed=0)
+        city = City.generate(env, n_people=60, n_stores=5, n_parks=2, n_misc=5)
+        ProcessSimulation(env, city).start()
+        env.run(until=7 * 24 * 60 / TICK_MINUTE)
+        humans = list(city.humans)
+        self.assertEqual(len({id(h.visits) for h in humans}), len(humans))
+        counters = [h.visits.stores for h in humans if h.visits.stores is not None]
+        self.assertEqual(len({id(counter) for counter in counters}), len(counters))
+        for human in humans:
+            self.assertIs(human.visits, city.humans.visits(human.name))
+
+
+class SickCountTest(unittest.TestCase):
+
+    def test_add_remove_infect(self):
+        env = Env(START_TIME, seed=0)
+        home = Location(env, location_type='household', lat=0, lon=0)
+        store = Location(env, location_type='store', lat=0, lon=0, cont_prob=0.1)
+        sick = Human(env, name=0, infection_time=0, household=home, workplace=home)
+        healthy = Human(env, name=1, infection_time=None, household=home, workplace=home)
+        store.add_human(healthy)
+        self.assertEqual(store.n_sick, 0)
+        self.assertEqual(store.contamination_proba(), 0)
+        store.add_human(sick)
+        store.add_human(sick)
+        self.assertEqual(store.n_sick, 1)
+        home.add_human(healthy)
+        healthy.infect(5)
+        healthy.infect(6)
+        self.assertEqual((store.n_sick, home.n_sick), (2, 1))
+        store.remove_human(sick)
+        self.assertEqual(store.n_sick, 1)
+        store.remove_human(healthy)
+        self.assertEqual((store.n_sick, home.n_sick), (0, 1))
+
+    def test_count_during_a_simulation(self):
+        env = Env(START_TIME, seed=1)
+        city = City.generate(env, n_people=100, n_stores=3, n_parks=2, n_misc=3, init_percent_sick=0.2)
+        simulation = ProcessSimulation(env, city)
+        simulation.start()
+        mismatches = []
+
+        def check():
+            while True:
+                for locations in simulation.locations.values():
+                    for location in locations.built():
+                        n_sick = sum(human.is_sick for human in location.humans)
+                        if location.n_sick != n_sick:
+                            mismatches.append((env.now, location.name, location.n_sick, n_sick))
+                yield env.timeout(10 / TICK_MINUTE)
+
+        env.process(check())
+        env.run(until=3 * 24 * 60 / TICK_MINUTE)
+        self.assertEqual(mismatches, [])
+        self.assertTrue(len(env.event_log.tables['contamination']))
+
+
+class EncounterModeTest(unittest.TestCase):
+
+    def encounter(self, encounter_mode):
+        """ event log of a human arriving at a store where two humans are """
+        env = Env(START_TIME, encounter_mode=encounter_mode, seed=0)
+        home = Location(env, location_type='household', lat=0, lon=0)
+        store = Location(env, location_type='store', lat=10, lon=20, cont_prob=0.1)
+        humans = [Human(env, name=i, infection_time=None, household=home, workplace=home) for i in range(3)]
+        for human, (start, leaving) in zip(humans, ((0, 30), (5, 12), (10, 40))):
+            human.start_time, human.leaving_time = start, leaving
+            store.add_human(human)
+        humans[2].encounter(store)
+        return env.event_log
+
+    def test_batched_same_as_pairs(self):
+        pairs = self.encounter('pairs').to_dicts()
+        self.assertEqual(len(pairs), 4)
+        self.assertEqual(self.encounter('batched').to_dicts(), pairs)
+
+    def test_aggregate(self):
+        event_log = self.encounter('aggregate')
+        self.assertEqual(len(event_log.tables['encounter']), 0)
+        contacts = event_log.to_dicts()
+        self.assertEqual([e['payload']['contacts'] for e in contacts], [2])
+        # overlaps of 20 and 2 ticks
+        self.assertEqual(contacts[0]['payload']['exposure'], 22 * TICK_MINUTE)
+
+
+class CityGenerateTest(unittest.TestCase):
+
+    def generate(self, seed):
+        env = Env(START_TIME, seed=seed)
+        return City.generate(env, n_people=90, n_stores=7, n_parks=3, n_misc=5, init_percent_sick=0.1,
+                             store_capacity=30, misc_capacity=10)
+
+    def test_sizes(self):
+        city = self.generate(0)
+        population = city.humans
+        self.assertEqual([len(city.stores), len(city.parks), len(city.miscs), len(population.households),
+                          len(population.workplaces), len(population)], [7, 3, 5, 45, 3, 90])
+        self.assertEqual(int((~np.isnan(population.infection_time)).sum()), 9)
+        for locations in (city.stores, city.parks, city.miscs, population.households, population.workplaces):
+            self.assertTrue(((0 <= locations.lat) & (locations.lat <= 1000)).all())
+            self.assertTrue(((0 <= locations.lon) & (locations.lon <= 1000)).all())
+        self.assertTrue(((15 <= city.stores.capacity) & (city.stores.capacity <= 45)).all())
+        self.assertTrue(((5 <= city.miscs.capacity) & (city.miscs.capacity <= 15)).all())
+        self.assertIsNone(city.parks.capacity)
+        self.assertTrue((population.household < 45).all() and (population.workplace < 3).all())
+
+    def test_humans(self):
+        population = self.generate(0).humans
+        human = population[4]
+        self.assertIs(population[4], human)
+        self.assertIs(human.household, population.households[population.household[4]])
+        self.assertIs(human.workplace, population.workplaces[population.workplace[4]])
+        self.assertEqual(human.shopping_hours, population.habits['shopping_hours'][4])
+        self.assertEqual(human.is_sick, not np.isnan(population.infection_time[4]))
+
+    def test_seeded(self):
+        first, second, other = self.generate(3), self.generate(3), self.generate(4)
+        for name in ('stores', 'miscs'):
+            np.testing.assert_array_equal(getattr(first, name).lat, getattr(second, name).lat)
+            np.testing.assert_array_equal(getattr(first, name).capacity, getattr(second, name).capacity)
+        np.testing.assert_array_equal(first.humans.household, second.humans.household)
+        self.assertFalse(np.array_equal(first.humans.household, other.humans.household))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+import config
+import processes
+import simulator
+from sweep import config_overrides
+
+
+class ConfigOverridesTest(unittest.TestCase):
+
+    def test_set_and_restored(self):
+        tick_minute = config.TICK_MINUTE
+        with config_overrides(TICK_MINUTE=5):
+            self.assertEqual((config.TICK_MINUTE, simulator.TICK_MINUTE), (5, 5))
+            self.assertEqual(simulator.ticks_per_day(), 24 * 60 / 5)
+            self.assertEqual(processes.TICK_MINUTE, 5)
+        self.assertEqual((config.TICK_MINUTE, simulator.TICK_MINUTE, processes.TICK_MINUTE), (tick_minute,) * 3)
+
+    def test_restored_on_error(self):
+        tick_minute = simulator.TICK_MINUTE
+        with self.assertRaises(KeyError):
+            with config_overrides(TICK_MINUTE=5):
+                raise KeyError()
+        self.assertEqual(simulator.TICK_MINUTE, tick_minute)
+
+    def test_unknown_parameter(self):
+        with self.assertRaises(ValueError):
+            with config_overrides(TICK_SECONDS=5):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
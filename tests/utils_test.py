@@ -0,0 +1,125 @@
+import unittest
+
+import numpy as np
+
+from utils import AliasTable, FenwickTree, TruncatedGaussianPool
+
+
+def frequencies(sampler, n, n_draws=100000):
+    """Share of each index among the draws of sampler over an even grid of
+    uniforms, which gives the exact probabilities up to 1 / n_draws."""
+
+    counts = np.zeros(n)
+    for u in (np.arange(n_draws) + 0.5) / n_draws:
+        counts[sampler.sample(u)] += 1
+    return counts / n_draws
+
+
+class TruncatedGaussianPoolTest(unittest.TestCase):
+
+    def test_distribution(self):
+        pool = TruncatedGaussianPool(np.random.default_rng(0))
+        values = np.array([pool.draw(100, 40) for _ in range(100000)])
+        self.assertEqual(values.dtype.kind, 'i')
+        self.assertEqual((values.min(), values.max()), (60, 140))
+        # a standard normal truncated to [-1, 1] has a standard deviation of 0.5396
+        self.assertAlmostEqual(values.mean(), 100, delta=0.3)
+        self.assertAlmostEqual(values.std(), 40 * 0.5396, delta=0.3)
+
+    def test_draw_array(self):
+        pool = TruncatedGaussianPool(np.random.default_rng(0))
+        avg = np.repeat([10, 1000], 50000)
+        values = pool.draw_array(avg, avg // 10)
+        for v, a in ((values[:50000], 10), (values[50000:], 1000)):
+            self.assertGreaterEqual(v.min(), a - a // 10)
+            self.assertLessEqual(v.max(), a + a // 10)
+            self.assertAlmostEqual(v.mean(), a, delta=a / 100)
+
+    def test_blocks_double_up_to_the_max(self):
+        pool = TruncatedGaussianPool(np.random.default_rng(0), block_size=4, max_block_size=16)
+        sizes = []
+        for _ in range(4 + 8 + 16 + 16):
+            pool.draw(5, 2)
+            sizes.append(pool.block_sizes[(5, 2)])
+        self.assertEqual(sizes, [8] * 4 + [16] * 8 + [16] * 32)
+        # the other pairs have their own buffers
+        pool.draw(7, 3)
+        self.assertEqual(pool.block_sizes[(7, 3)], 8)
+        self.assertEqual(len(pool.buffers[(5, 2)]), 0)
+
+    def test_state(self):
+        pool = TruncatedGaussianPool(np.random.default_rng(0), block_size=4)
+        for _ in range(6):
+            pool.draw(5, 2)
+        state = pool.get_state()
+        expected = [pool.draw(5, 2) for _ in range(20)] + [pool.draw(9, 1) for _ in range(5)]
+        restored = TruncatedGaussianPool(np.random.default_rng(1), block_size=4)
+        restored.set_state(state)
+        self.assertEqual([restored.draw(5, 2) for _ in range(20)] + [restored.draw(9, 1) for _ in range(5)], expected)
+
+
+class AliasTableTest(unittest.TestCase):
+
+    def test_draws_in_proportion_to_weights(self):
+        weights = np.array([1, 5, 0, 2, 12, 0.5])
+        table = AliasTable(weights)
+        np.testing.assert_allclose(frequencies(table, len(weights)), weights / weights.sum(), atol=1e-4)
+
+    def test_zero_weights_never_drawn(self):
+        table = AliasTable([0, 3, 0, 0, 1])
+        drawn = {table.sample(u) for u in np.linspace(0, 1, 1001)[:-1]}
+        self.assertEqual(drawn, {1, 4})
+
+    def test_random_weights(self):
+        rng = np.random.default_rng(0)
+        weights = rng.random(50)
+        table = AliasTable(weights)
+        self.assertEqual(table.total, weights.sum())
+        np.testing.assert_allclose(frequencies(table, len(weights)), weights / weights.sum(), atol=1e-4)
+
+
+class FenwickTreeTest(unittest.TestCase):
+
+    def tree(self, values):
+        tree = FenwickTree()
+        for value in values:
+            tree.append(value)
+        return tree
+
+    def test_prefix_sums(self):
+        values = [3, 0, 7, 1, 1, 4, 0, 2, 9, 5, 6]
+        tree = self.tree(values)
+        self.assertEqual(len(tree), len(values))
+        self.assertEqual(tree.total, sum(values))
+        for n in range(len(values) + 1):
+            self.assertEqual(tree.prefix_sum(n), sum(values[:n]))
+
+    def test_add(self):
+        values = [3, 0, 7, 1, 1, 4, 0, 2, 9]
+        tree = self.tree(values)
+        for index, delta in ((0, 2), (6, 5), (8, -9), (3, 1)):
+            tree.add(index, delta)
+            values[index] += delta
+        for n in range(len(values) + 1):
+            self.assertEqual(tree.prefix_sum(n), sum(values[:n]))
+        self.assertEqual(tree.total, sum(values))
+
+    def test_draws_in_proportion_to_values(self):
+        values = np.array([3, 0, 7, 1, 1, 4, 0, 2, 9, 5, 6])
+        tree = self.tree(values.tolist())
+        np.testing.assert_allclose(frequencies(tree, len(values)), values / values.sum(), atol=1e-4)
+
+    def test_draws_after_updates(self):
+        values = [1] * 10
+        tree = self.tree(values)
+        tree.add(2, 9)
+        tree.add(7, -1)
+        values[2] += 9
+        values[7] -= 1
+        frequency = frequencies(tree, len(values))
+        np.testing.assert_allclose(frequency, np.array(values) / sum(values), atol=1e-4)
+        self.assertEqual(frequency[7], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
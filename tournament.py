@@ -0,0 +1,98 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from Beating_Covid import Graph
+from utils import _dump_rows
+
+STRATEGIES = ['node_to_vaccinate', 'node_to_vaccinate_alternate', 'node_to_vaccinate_alternate_alpha']
+
+
+def random_contact_graph(n_nodes, density, seed=None, graph_class=Graph):
+    """Random contact graph where every pair of nodes is connected with
+    probability density. Weights are drawn like the ones of the demo graph
+    (multiples of 10 up to 1000) and the first infected node is random. The
+    graph is a graph_class, Graph or CompactGraph."""
+
+    rng = random.Random(seed)
+    node_ids = [i for i in range(1, n_nodes + 1)]
+    weights = [10 * rng.randint(1, 100) for _ in node_ids]
+    graph = graph_class(node_ids, weights, first_infected_node_id=rng.choice(node_ids))
+    graph.add_connections([(i, j) for i in node_ids for j in node_ids if i < j and rng.random() < density])
+    return graph
+
+
+def choose_node(graph, strategy):
+    if strategy == 'node_to_vaccinate':
+        return graph.node_to_vaccinate()
+    elif strategy == 'node_to_vaccinate_alternate':
+        return graph.node_to_vaccinate_alternate()[0]
+    elif strategy == 'node_to_vaccinate_alternate_alpha':
+        return graph.node_to_vaccinate_alternate_alpha()[0]
+    raise ValueError(f'Unknown strategy:{strategy}')
+
+
+def play_game(game, strategy, n_nodes, density, seed):
+    """Plays one game with the strategy on the random graph of this game and
+    returns its row of the results table."""
+
+    graph = random_contact_graph(n_nodes, density, seed=seed + game)
+    total_weight = graph.get_sum_of_weights_of_all_healthy_nodes() + graph.get_sum_of_weights_of_all_infected_nodes()
+    move_times = []
+    while len(graph.get_nodes_that_will_be_infected_in_next_step()):
+        start_time = time.time()
+        node_id = choose_node(graph, strategy)
+        move_times.append(time.time() - start_time)
+        graph.play_one_step(node_id)
+
+    return {
+        'game': game,
+        'strategy': strategy,
+        'n_nodes': n_nodes,
+        'density': density,
+        'moves': len(move_times),
+        'saved_weight': graph.get_sum_of_weights_of_all_healthy_nodes(),
+        'total_weight': total_weight,
+        'time_per_move': sum(move_times) / len(move_times) if move_times else 0,
+        'max_time_per_move': max(move_times) if move_times else 0,
+    }
+
+
+def run_tournament(n_games=10, n_nodes=30, density=0.08, strategies=None, workers=None, seed=None):
+    """Plays n_games random graphs with every strategy over a process pool.
+    All strategies play the same graphs, so their rows can be compared game
+    by game. Returns the rows ordered by game and strategy."""
+
+    strategies = strategies or STRATEGIES
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown strategy:{strategy}')
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    jobs = [(game, strategy) for game in range(n_games) for strategy in strategies]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(play_game, game, strategy, n_nodes, density, seed) for game, strategy in jobs]
+        return [future.result() for future in futures]
+
+
+@click.command()
+@click.option('--n_games', help='number of random graphs to play', type=int, default=10)
+@click.option('--n_nodes', help='number of nodes of every graph', type=int, default=30)
+@click.option('--density', help='probability that two nodes are connected', type=float, default=0.08)
+@click.option('--strategy', 'strategies', help='strategy to play, can be repeated (default: all)', multiple=True,
+              type=click.Choice(STRATEGIES))
+@click.option('--workers', help='number of worker processes (default: one per core)', type=int, default=None)
+@click.option('--seed', help='seed of the random graphs', type=int, default=None)
+@click.option('--outfile', help='filename of the output (file format: .csv or .json)', type=str, required=False)
+def tournament(n_games=10, n_nodes=30, density=0.08, strategies=None, workers=None, seed=None, outfile=None):
+    results = run_tournament(
+        n_games=n_games, n_nodes=n_nodes, density=density, strategies=list(strategies),
+        workers=workers, seed=seed,
+    )
+    _dump_rows(results, outfile)
+
+
+if __name__ == "__main__":
+    tournament()
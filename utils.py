@@ -1,13 +1,222 @@
+import csv
+import json
+import sys
+import zlib
 import numpy as np
-from scipy.stats import truncnorm
 import datetime
+from array import array
 
 def _normalize_scores(scores):
     return np.array(scores)/np.sum(scores)
 
-def _draw_random_discreet_gaussian(avg, scale):
-    # https://stackoverflow.com/a/37411711/3413239
-    return int(truncnorm(a=-1, b=1, loc=avg, scale=scale).rvs(1).round().astype(int)[0])
+
+class TruncatedGaussianPool(object):
+    """Pre-draws values of the integer gaussians used by the simulator in
+    NumPy blocks, one refillable buffer per (avg, scale) pair, instead of
+    building a scipy distribution for every single draw. Values follow a
+    normal distribution truncated at one scale around avg, rounded to the
+    nearest integer. Blocks start small and double at every refill, so
+    pairs that are rarely drawn only cost a few values of memory. The
+    values are drawn from the NumPy Generator rng, a stream of
+    RandomStreams."""
+
+    def __init__(self, rng, block_size=64, max_block_size=65536):
+        self.rng = rng
+        self.block_size = block_size
+        self.max_block_size = max_block_size
+        self.buffers = {}
+        self.block_sizes = {}
+
+    def get_state(self):
+        return {
+            'rng': self.rng.bit_generator.state,
+            'buffers': {key: list(values) for key, values in self.buffers.items()},
+            'block_sizes': dict(self.block_sizes),
+        }
+
+    def set_state(self, state):
+        self.rng.bit_generator.state = state['rng']
+        self.buffers = {key: list(values) for key, values in state['buffers'].items()}
+        self.block_sizes = dict(state['block_sizes'])
+
+    def standard_block(self, size):
+        """size draws of a standard normal truncated to [-1, 1]."""
+        block = np.empty(0)
+        while len(block) < size:
+            # about 68% of the draws are kept
+            z = self.rng.standard_normal(int(1.5 * (size - len(block))) + 16)
+            block = np.concatenate([block, z[np.abs(z) <= 1]])
+        return block[:size]
+
+    def draw(self, avg, scale):
+        # https://stackoverflow.com/a/37411711/3413239
+        key = (avg, scale)
+        values = self.buffers.get(key)
+        if not values:
+            size = self.block_sizes.get(key, self.block_size)
+            self.block_sizes[key] = min(2 * size, self.max_block_size)
+            values = self.buffers[key] = np.rint(avg + scale * self.standard_block(size)).astype(int).tolist()
+        return values.pop()
+
+    def draw_array(self, avg, scale):
+        """one draw for each pair of values of the arrays avg and scale."""
+        avg = np.asarray(avg)
+        return np.rint(avg + np.asarray(scale) * self.standard_block(len(avg))).astype(int)
+
+
+class RandomStreams(object):
+    """Independent NumPy Generators derived from one seed: one per named
+    component of the simulation and one per agent. Each stream is the child
+    of the seed's SeedSequence that spawn would make, addressed by a key
+    instead of by order of creation, so it only depends on the seed and on
+    its name or agent number: draws made from the other streams, in
+    whichever order, never shift it."""
+
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.components = {}
+        self.pools = {}
+
+    @property
+    def entropy(self):
+        """seed which reproduces the streams, drawn from the OS when none was given"""
+        return self.seed_sequence.entropy
+
+    def _spawn(self, *key):
+        seed_sequence = np.random.SeedSequence(self.entropy, spawn_key=self.seed_sequence.spawn_key + key)
+        return np.random.Generator(np.random.PCG64(seed_sequence))
+
+    def component(self, name):
+        generator = self.components.get(name)
+        if generator is None:
+            generator = self.components[name] = self._spawn(0, zlib.crc32(name.encode()))
+        return generator
+
+    def gaussians(self, name):
+        """TruncatedGaussianPool drawing from the stream of the component name"""
+        pool = self.pools.get(name)
+        if pool is None:
+            pool = self.pools[name] = TruncatedGaussianPool(self.component(name))
+        return pool
+
+    def agent(self, i):
+        """new generator of the stream of the agent number i"""
+        return self._spawn(1, i)
+
+    def get_state(self):
+        """states of the component streams and of their pools, agent streams are held by the agents"""
+        return {
+            'components': {name: generator.bit_generator.state for name, generator in self.components.items()},
+            'pools': {name: pool.get_state() for name, pool in self.pools.items()},
+        }
+
+    def set_state(self, state):
+        for name, generator_state in state['components'].items():
+            self.component(name).bit_generator.state = generator_state
+        for name, pool_state in state['pools'].items():
+            self.gaussians(name).set_state(pool_state)
+
+
+class AliasTable(object):
+    """Walker's alias method: draws an index with probability proportional to
+    fixed weights in O(1), after an O(n) construction. Indexes with a zero
+    weight are never drawn. The table is kept as float32 and int32 arrays,
+    8 bytes per index."""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        self.n = len(weights)
+        self.total = float(weights.sum())
+        prob = [1.0] * self.n
+        alias = list(range(self.n))
+        if self.total > 0:
+            scaled = (weights * self.n / self.total).tolist()
+            small = [i for i, p in enumerate(scaled) if p < 1]
+            large = [i for i, p in enumerate(scaled) if p >= 1]
+            while small and large:
+                s, l = small.pop(), large.pop()
+                prob[s] = scaled[s]
+                alias[s] = l
+                scaled[l] = scaled[l] + scaled[s] - 1
+                (small if scaled[l] < 1 else large).append(l)
+        self.prob = np.array(prob, dtype=np.float32)
+        self.alias = np.array(alias, dtype=np.int32)
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self) + self.prob.nbytes + self.alias.nbytes
+
+    def sample(self, u):
+        """index drawn from a uniform u in [0, 1), the table must have a positive total."""
+        u = u * self.n
+        i = int(u)
+        return i if u - i < self.prob[i] else int(self.alias[i])
+
+
+class FenwickTree(object):
+    """Non negative integer values over indexes 0..n-1, stored in a compact
+    array, with O(log n) updates, appends and sampling of an index in
+    proportion to its value."""
+
+    __slots__ = ('tree', 'total')
+
+    def __init__(self):
+        self.tree = array('i', [0])
+        self.total = 0
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.tree)
+
+    def prefix_sum(self, n):
+        """sum of the first n values"""
+        total = 0
+        while n:
+            total += self.tree[n]
+            n -= n & -n
+        return total
+
+    def add(self, index, delta):
+        self.total += delta
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def append(self, value):
+        m = len(self.tree)
+        self.tree.append(value + self.prefix_sum(m - 1) - self.prefix_sum(m - (m & -m)))
+        self.total += value
+
+    def sample(self, u):
+        """index drawn from a uniform u in [0, 1), the tree must have a positive total."""
+        target = u * self.total
+        pos = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if pos + step < len(self.tree) and self.tree[pos + step] <= target:
+                pos += step
+                target -= self.tree[pos]
+            step >>= 1
+        return pos
+
+
+def _dump_rows(rows, dest=None):
+    """ prints the rows of a results table as JSON, or writes them to dest (file format: .csv or .json) """
+    if dest is None:
+        print(json.dumps(rows, indent=1))
+        return
+
+    with open(dest, 'w', newline='') as f:
+        if dest.endswith('.json'):
+            json.dump(rows, f, indent=1)
+        else:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
 
 def _json_serialize(o):
     if isinstance(o, datetime.datetime):
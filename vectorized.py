@@ -0,0 +1,370 @@
+import bisect
+
+import numpy as np
+
+from config import *  # PARAMETERS
+from simulator import LOCATION_TYPES, City, Event, Human, LocationArray, LocationStub, Population, ticks_per_day
+
+
+class VectorizedSimulation(object):
+    """
+    Time stepped alternative to running one SimPy process per Human. The population is stepped one hour at a time
+    on NumPy arrays of agent state (location, activity, schedule, infection tick), following the schedule of
+    Human.run: an agent checks its schedule, does at most one activity (work, shopping, exercise or a trip through
+    miscs), then stays home for 60 minutes before its next check. Activities which end past the hour make the agent
+    skip the next checks, like the SimPy processes do.
+
+    Every stay at a location is a visit [start, end) in minutes since the start of the simulation. Visits are
+    resolved in the hour of their start, grouped by location: an arriving agent meets the agents present at its
+    location and may be contaminated by the sick ones, as in Human.at. Locations are chosen with the same
+    exploration and preferential return as Human._select_location. The agents are the Population of the City, or
+    are read from its list of humans. Location capacities are not enforced.
+
+    Each kind of draw (tests, trips, location choices, durations, encounters, contaminations) has its own stream of
+    env.rng, the draws of all the agents being made at once.
+    """
+    activities = dict(Human.actions, working=2, trip=5)
+
+    def __init__(self, env, city):
+        self.env = env
+        self.city = city
+        self.rng = {name: env.rng.component(name)
+                    for name in ('tests', 'trips', 'locations', 'encounters', 'contaminations')}
+        self.durations = env.rng.gaussians('durations')
+        if isinstance(city.humans, Population):
+            population = city.humans
+        else:
+            population = Population.from_humans(city.humans, city.households)
+        self.population = population
+
+        # locations of all the types, one after the other
+        self.location_types = [('stores', city.stores), ('parks', city.parks), ('miscs', city.miscs),
+                               ('households', population.households), ('workplaces', population.workplaces)]
+        self.offsets = {}
+        offset = 0
+        for location_type, locations in self.location_types:
+            self.offsets[location_type] = offset
+            offset += len(locations)
+        self.starts = [self.offsets[location_type] for location_type, _ in self.location_types]
+        self.cont_prob = np.concatenate([self._cont_prob(locations) for _, locations in self.location_types])
+        self.is_household = np.zeros(len(self.cont_prob), dtype=bool)
+        self.is_household[self.offsets['households']:self.offsets['workplaces']] = True
+        # ids of the locations in the EventLog, -1 until their first event
+        self.event_location_ids = np.full(len(self.cont_prob), -1, dtype=np.int64)
+
+        # agents
+        self.names = population.names
+        self.household = population.household + self.offsets['households']
+        self.workplace = population.workplace + self.offsets['workplaces']
+        self.location = self.household.copy()
+        self.activity = np.full(len(population), self.activities['at_home'], dtype=np.int8)
+        self.infection_time = population.infection_time.copy()
+        self.tested = np.zeros(len(population), dtype=bool)
+        self.rho = population.rho
+        self.gamma = population.gamma
+        for habit in ('work_start_hour', 'shopping_days', 'shopping_hours', 'exercise_days', 'exercise_hours',
+                      'avg_shopping_time', 'scale_shopping_time', 'avg_working_hours', 'scale_working_hours',
+                      'avg_misc_time', 'scale_misc_time'):
+            setattr(self, habit, np.asarray(population.habits[habit], dtype=np.int64))
+
+        # the next schedule check of an agent is at minute phase of the hour step next_check
+        self.phase = np.zeros(len(population))
+        self.next_check = np.zeros(len(population), dtype=np.int64)
+        self.hour = 0
+        # visits which started before the current hour and are not over, and visits which did not start yet
+        self.present = self._no_visits()
+        self.pending = self._no_visits()
+
+    @staticmethod
+    def _cont_prob(locations):
+        if isinstance(locations, LocationArray):
+            return locations.cont_prob
+        return np.array([location.cont_prob for location in locations], dtype=np.float64)
+
+    def get_location(self, l):
+        """ Location of the index l of the locations of all the types """
+        k = bisect.bisect_right(self.starts, l) - 1
+        return self.location_types[k][1][l - self.starts[k]]
+
+    def get_source(self, l):
+        """ location of the index l to choose a location from: a LocationStub for the ones of LocationArrays, so that
+        households are not built as Locations """
+        k = bisect.bisect_right(self.starts, l) - 1
+        locations = self.location_types[k][1]
+        i = l - self.starts[k]
+        if isinstance(locations, LocationArray):
+            return LocationStub(locations.location_type, i, locations.lat[i].item(), locations.lon[i].item())
+        return locations[i]
+
+    def location_index(self, location):
+        """ index among the locations of all the types of a Location of the city """
+        for location_type, singular in LOCATION_TYPES.items():
+            if location.location_type == singular:
+                return self.offsets[location_type] + location.index
+        raise ValueError(f'Unknown location_type:{location.location_type}')
+
+    @staticmethod
+    def _no_visits():
+        return {'agent': np.empty(0, dtype=np.int64), 'location': np.empty(0, dtype=np.int64),
+                'start': np.empty(0), 'end': np.empty(0)}
+
+    @staticmethod
+    def _concat_visits(*visits):
+        return {k: np.concatenate([v[k] for v in visits]) for k in ('agent', 'location', 'start', 'end')}
+
+    @staticmethod
+    def _take_visits(visits, keep):
+        return {k: v[keep] for k, v in visits.items()}
+
+    @property
+    def is_sick(self):
+        return ~np.isnan(self.infection_time)
+
+    def run(self, until, checkpoint_every=None, on_checkpoint=None):
+        """
+        steps the simulation hour by hour up to the tick until, running the processes of env along. every
+        checkpoint_every hours, and at until, on_checkpoint is called with the state of the simulation.
+        """
+        ticks_per_hour = 60 / TICK_MINUTE
+        start_hour = self.hour
+        while self.hour * ticks_per_hour < until:
+            if self.hour * ticks_per_hour > self.env.now:
+                self.env.run(until=self.hour * ticks_per_hour)
+            if checkpoint_every and self.hour != start_hour and self.hour % checkpoint_every == 0:
+                on_checkpoint(self.checkpoint())
+            self.step()
+            self.hour += 1
+        if until > self.env.now:
+            self.env.run(until=until)
+        if checkpoint_every and self.hour != start_hour and self.hour % checkpoint_every == 0:
+            on_checkpoint(self.checkpoint())
+
+    dynamic_state = ('infection_time', 'tested', 'location', 'activity', 'phase', 'next_check')
+
+    def checkpoint(self):
+        """
+        state of the simulation at the start of the current hour step: the city, the agents, their visits, the
+        event log (up to the offset of its sink) and the states of the random generators. see restore.
+        """
+        return {
+            'hour': self.hour,
+            'now': self.env.now,
+            'city': self.city.get_state(self.population),
+            'agents': {name: getattr(self, name) for name in self.dynamic_state},
+            'present': self.present,
+            'pending': self.pending,
+            'event_log': self.env.event_log.get_state(self.location_index),
+            'random': self.env.rng.get_state(),
+        }
+
+    @classmethod
+    def restore(cls, env, state, monitors=()):
+        """
+        simulation of a checkpoint, on a new env. the monitors are started at time 0 like in a run from the start
+        and the env is run up to the time of the checkpoint before the event log is restored, so that they see the
+        same events at the same times as in an uninterrupted run.
+        """
+        city = City.from_state(env, state['city'])
+        simulation = cls(env, city)
+        simulation.hour = state['hour']
+        for name in cls.dynamic_state:
+            setattr(simulation, name, state['agents'][name].copy())
+        simulation.present = state['present']
+        simulation.pending = state['pending']
+
+        for m in monitors:
+            env.process(m.run(env, city=city))
+        if state['now'] > env.now:
+            env.run(until=state['now'])
+        env.event_log.set_state(state['event_log'], simulation.get_location)
+        for location in env.event_log.locations:
+            simulation.event_location_ids[simulation.location_index(location)] = env.event_log.location_id(location)
+
+        env.rng.set_state(state['random'])
+        return simulation
+
+    def step(self):
+        hour_start = 60 * self.hour
+        hour_of_day, day_of_week = self.env.hour_of_day(), self.env.day_of_week()
+        weekend = day_of_week in (0, 6)
+
+        agents = np.flatnonzero((self.next_check == self.hour) & ~self.tested)
+        check_time = hour_start + self.phase[agents]
+
+        # Simulate some tests
+        tested = (self.is_sick[agents] &
+                  (check_time / TICK_MINUTE - self.infection_time[agents] > INCUBATION_DAYS * ticks_per_day()))
+        if tested.any():
+            self.log(Event.test, human_id=self.names[agents[tested]], time=check_time[tested] / TICK_MINUTE,
+                     result=self.rng['tests'].random(tested.sum()) > 0.8)
+            self.tested[agents[tested]] = True
+            agents, check_time = agents[~tested], check_time[~tested]
+
+        working = (self.work_start_hour[agents] == hour_of_day) & (not weekend) & (not WORK_FROM_HOME)
+        shopping = ~working & (self.shopping_hours[agents] == hour_of_day) & (self.shopping_days[agents] == day_of_week)
+        exercising = (~working & ~shopping & (self.exercise_hours[agents] == hour_of_day) &
+                      (self.exercise_days[agents] == day_of_week))
+        trip = ~(working | shopping | exercising) & weekend & (self.rng['trips'].random(len(agents)) < 0.05)
+        self.activity[agents] = self.activities['at_home']
+        for activity, mask in (('working', working), ('shopping', shopping), ('exercise', exercising),
+                               ('trip', trip)):
+            self.activity[agents[mask]] = self.activities[activity]
+
+        # visits of the activities
+        duration = np.zeros(len(agents))
+        visits = []
+        if working.any():
+            t = self.durations.draw_array(self.avg_working_hours[agents[working]],
+                                          self.scale_working_hours[agents[working]])
+            visits.append(self._visits(agents[working], self.workplace[agents[working]], check_time[working], t))
+            duration[working] = t
+        # exercise lasts as long as shopping, like in Human.exercise
+        for mask, location_type in ((shopping, 'stores'), (exercising, 'parks')):
+            if mask.any():
+                locations = [self.choose_location(agent, location_type) for agent in agents[mask]]
+                t = self.durations.draw_array(self.avg_shopping_time[agents[mask]],
+                                              self.scale_shopping_time[agents[mask]])
+                visits.append(self._visits(agents[mask], np.array(locations, dtype=np.int64), check_time[mask], t))
+                duration[mask] = t
+        for i in np.flatnonzero(trip):
+            trip_visits = self.take_a_trip(agents[i], check_time[i])
+            visits.append(trip_visits)
+            duration[i] = trip_visits['end'][-1] - check_time[i]
+
+        # then stay at home
+        home_time = check_time + duration
+        visits.append(self._visits(agents, self.household[agents], home_time, np.full(len(agents), 60)))
+        next_check = home_time + 60
+        self.next_check[agents] = next_check // 60
+        self.phase[agents] = next_check % 60
+
+        self.pending = self._concat_visits(self.pending, *visits)
+        self.resolve(hour_start, hour_start + 60)
+
+    @staticmethod
+    def _visits(agents, locations, start, duration):
+        start = np.asarray(start, dtype=np.float64)
+        return {'agent': agents, 'location': locations, 'start': start, 'end': start + duration}
+
+    def choose_location(self, agent, location_type, source=None):
+        """ index among the locations of all the types of the store, park or misc (from source) chosen by agent """
+        visited_locs = self.population.visits(agent).counter(location_type)
+        household = self.household[agent] - self.offsets['households']
+        if location_type == 'stores':
+            pool_pref = self.city.stores_preferences[household]
+        elif location_type == 'parks':
+            pool_pref = self.city.parks_preferences[household]
+        else:
+            pool_pref = self.city.miscs_preferences(source)
+
+        if source is None:
+            source = self.get_source(self.household[agent])
+        sampler = self.city.preference_sampler(location_type, source)
+        index = Human._choose_location(len(visited_locs), self.rho[agent], self.gamma[agent], pool_pref, sampler,
+                                       visited_locs, self.rng['locations'])
+        return self.offsets[location_type] + index
+
+    def take_a_trip(self, agent, start):
+        """ visits of a trip through miscs starting at start, like Human.take_a_trip """
+        locations, durations = [], []
+        source = self.get_source(self.household[agent])
+        S = 0
+        p_exp = 1.0
+        while self.rng['trips'].random() <= p_exp:
+            location = self.choose_location(agent, 'miscs', source)
+            source = self.get_source(location)
+            S += 1
+            p_exp = self.rho[agent] * S ** (-self.gamma[agent])
+            locations.append(location)
+            durations.append(self.durations.draw(self.avg_misc_time[agent], self.scale_misc_time[agent]))
+        # return home
+        locations.append(self.household[agent])
+        durations.append(60)
+        ends = start + np.cumsum(durations, dtype=np.float64)
+        return {'agent': np.full(len(locations), agent, dtype=np.int64), 'location': np.array(locations),
+                'start': ends - durations, 'end': ends}
+
+    def resolve(self, start, end):
+        """
+        Encounters and contaminations of the visits starting in [start, end). An arriving agent meets the agents
+        whose visit of the same location started before and is not over.
+        """
+        arriving = self.pending['start'] < end
+        arrivals = self._take_visits(self.pending, arriving)
+        self.pending = self._take_visits(self.pending, ~arriving)
+        visits = self._concat_visits(self.present, arrivals)
+        is_arrival = np.arange(len(visits['agent'])) >= len(self.present['agent'])
+
+        order = np.lexsort((self.rng['encounters'].random(len(is_arrival)), visits['start'], visits['location']))
+        visits = self._take_visits(visits, order)
+        is_arrival = is_arrival[order]
+        agent, location, visit_start, visit_end = visits['agent'], visits['location'], visits['start'], visits['end']
+        group_start = np.searchsorted(location, location, side='left')
+
+        # pairs (i, j) of an arrival i with every visit j of its location before it in the order
+        arrival = np.flatnonzero(is_arrival)
+        counts = arrival - group_start[arrival]
+        arrival_index = np.repeat(np.arange(len(arrival)), counts)
+        i = arrival[arrival_index]
+        j = np.repeat(group_start[arrival], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                                                          counts)
+        met = (visit_end[j] > visit_start[i]) & (agent[j] != agent[i])
+        arrival_index, i, j = arrival_index[met], i[met], j[met]
+
+        self.contaminate(arrival, arrival_index, j, visits)
+        encounters = ~self.is_household[location[i]]
+        self.log_encounters(i[encounters], j[encounters], visits, start)
+
+        arrived = np.argsort(visit_start[arrival], kind='stable')
+        self.location[agent[arrival[arrived]]] = location[arrival[arrived]]
+        self.present = self._take_visits(visits, visit_end > end)
+
+    def contaminate(self, arrival, arrival_index, j, visits):
+        agent, location, visit_start = visits['agent'], visits['location'], visits['start']
+        infection_time = self.infection_time
+        sick = infection_time[agent[j]] <= visit_start[arrival[arrival_index]] / TICK_MINUTE
+        n_sick = np.bincount(arrival_index, weights=sick, minlength=len(arrival))
+        cont_prob = self.cont_prob[location[arrival]]
+        if DOSE_DEPENDENT_CONTAMINATION:
+            cont_prob = 1 - (1 - cont_prob) ** n_sick
+        infected = ((n_sick > 0) & np.isnan(infection_time[agent[arrival]]) &
+                    (self.rng['contaminations'].random(len(arrival)) < cont_prob))
+        if not infected.any():
+            return
+        infected = arrival[infected]
+        # an agent is only contaminated at the first of its visits
+        infected = infected[np.argsort(visit_start[infected], kind='stable')]
+        _, first = np.unique(agent[infected], return_index=True)
+        infected = infected[first]
+        infection_time[agent[infected]] = visit_start[infected] / TICK_MINUTE
+        self.log(Event.contamination, human_id=self.names[agent[infected]], time=visit_start[infected] / TICK_MINUTE)
+
+    def log_encounters(self, i, j, visits, start):
+        if not len(i):
+            return
+        agent, location, visit_start, visit_end = visits['agent'], visits['location'], visits['start'], visits['end']
+        durations = np.minimum(visit_end[i], visit_end[j]) - visit_start[i]
+        if self.env.encounter_mode == 'aggregate':
+            contacts = np.bincount(location[i], minlength=len(self.cont_prob))
+            exposure = np.bincount(location[i], weights=durations, minlength=len(self.cont_prob))
+            for l in np.flatnonzero(contacts):
+                self.env.event_log.log_contacts(self.get_location(l), int(contacts[l]), float(exposure[l]),
+                                                time=start / TICK_MINUTE)
+            return
+        self.log(Event.encounter, human_id=self.names[agent[i]], time=visit_start[i] / TICK_MINUTE,
+                 encounter_human_id=self.names[agent[j]], location_id=self.event_location_id(location[i]),
+                 duration=durations, distance=self.rng['encounters'].integers(50, 1000, size=len(i)))
+
+    def event_location_id(self, locations):
+        """ ids in the EventLog of an array of indexes among the locations of all the types """
+        ids = self.event_location_ids
+        for l in np.unique(locations[ids[locations] < 0]):
+            ids[l] = self.env.event_log.location_id(self.get_location(l))
+        return ids[locations]
+
+    def log(self, event_type, **columns):
+        n = len(columns['human_id'])
+        rows = np.empty(n, dtype=self.env.event_log.tables[event_type].dtype)
+        for name, values in columns.items():
+            rows[name] = values
+        self.env.event_log.extend(event_type, rows)